@@ -0,0 +1,206 @@
+"""API JSON en lecture seule (/api/v1) : articles, documents et tags.
+
+Chaque liste est paginée par curseur (next_cursor, à renvoyer dans cursor=).
+fields= choisit les champs renvoyés : seules les colonnes correspondantes
+sont lues en base, sans passer par les objets ORM. updated_since= ne renvoie
+que les lignes modifiées depuis une date, de la plus ancienne à la plus
+récente : un client reprend la synchronisation à la date du dernier élément
+reçu. Les suppressions n'y apparaissent pas ; une liste fields=id complète
+permet de les retrouver à moindre coût.
+"""
+import json
+from collections import defaultdict, namedtuple
+from datetime import datetime, timezone
+
+from flask import current_app, request, url_for
+from sqlalchemy import DateTime, and_, or_, select
+
+from listing import decode_cursor, encode_cursor, tag_filter
+from models import db, Article, Document, Tag, document_tags
+from tags import normalize_tag_names
+
+# columns : champ -> colonne ; computed : champs calculés après la requête ;
+# order : tri par défaut (colonne, sens) ; updated : colonne de updated_since
+Resource = namedtuple('Resource', 'columns computed defaults order updated')
+
+RESOURCES = {
+    'articles': Resource(
+        {
+            'id': Article.id, 'title': Article.title, 'excerpt': Article.excerpt,
+            'content': Article.content, 'content_html': Article.content_html,
+            'created_date': Article.created_date, 'updated_date': Article.updated_date,
+        },
+        ('url',),
+        # Contenu complet seulement sur demande
+        ('id', 'title', 'excerpt', 'created_date', 'updated_date', 'url'),
+        (Article.created_date, 'desc'),
+        Article.updated_date,
+    ),
+    'documents': Resource(
+        {
+            'id': Document.id, 'title': Document.title, 'author': Document.author, 'year': Document.year,
+            'description': Document.description, 'original_filename': Document.original_filename,
+            'file_size': Document.file_size, 'upload_date': Document.upload_date,
+            'updated_date': Document.updated_date,
+        },
+        ('tags', 'url'),
+        ('id', 'title', 'author', 'year', 'description', 'original_filename', 'file_size',
+         'upload_date', 'updated_date', 'tags', 'url'),
+        (Document.upload_date, 'desc'),
+        Document.updated_date,
+    ),
+    'tags': Resource(
+        {'id': Tag.id, 'name': Tag.name, 'document_count': Tag.document_count},
+        (),
+        ('id', 'name', 'document_count'),
+        (Tag.name, 'asc'),
+        None,
+    ),
+}
+
+
+class ApiError(ValueError):
+    """Paramètre invalide : réponse 400 avec le message"""
+
+
+def _iso(value):
+    return value.isoformat() + 'Z' if value is not None else None
+
+
+def _parse_date(value):
+    try:
+        date = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        raise ApiError(f"Date invalide : {value}")
+    if date.tzinfo is not None:
+        # Les dates sont enregistrées en UTC, sans fuseau
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date
+
+
+def _fields(resource, value):
+    available = list(resource.columns) + list(resource.computed)
+    if not value:
+        return list(resource.defaults)
+    fields = []
+    for name in value.split(','):
+        name = name.strip()
+        if name not in available:
+            raise ApiError(f"Champ inconnu : {name} (disponibles : {', '.join(available)})")
+        if name not in fields:
+            fields.append(name)
+    return fields
+
+
+def _filters(name, args):
+    if name != 'documents':
+        return []
+    filters = []
+    tags = normalize_tag_names(args.getlist('tag'))
+    if tags:
+        filters.append(tag_filter(tags, 'any' if args.get('match') == 'any' else 'all'))
+    if args.get('year'):
+        year = args.get('year', type=int)
+        if year is None:
+            raise ApiError(f"Année invalide : {args.get('year')}")
+        filters.append(Document.year == year)
+    return filters
+
+
+def _document_tags(ids):
+    """Noms des tags de chaque document de la page, en une requête"""
+    names = defaultdict(list)
+    rows = db.session.execute(
+        select(document_tags.c.document_id, Tag.name)
+        .join(Tag, Tag.id == document_tags.c.tag_id)
+        .where(document_tags.c.document_id.in_(ids))
+        .order_by(Tag.name))
+    for document_id, tag_name in rows:
+        names[document_id].append(tag_name)
+    return names
+
+
+def list_resource(name, args):
+    """Page d'une ressource : {'data': [...], 'next_cursor': ..., 'next': URL de la page suivante}"""
+    resource = RESOURCES[name]
+    config = current_app.config
+    fields = _fields(resource, args.get('fields'))
+    limit = args.get('limit', config['API_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, config['API_MAX_PAGE_SIZE']))
+
+    id_column = resource.columns['id']
+    key, direction = resource.order
+    filters = _filters(name, args)
+    if args.get('updated_since'):
+        if resource.updated is None:
+            raise ApiError(f"updated_since n'est pas disponible pour {name}")
+        # Synchronisation : des plus anciennes modifications aux plus récentes
+        key, direction = resource.updated, 'asc'
+        filters.append(key >= _parse_date(args['updated_since']))
+
+    if args.get('cursor'):
+        # 'recent' : la valeur du curseur est une date (voir listing.decode_cursor)
+        position = decode_cursor(args['cursor'], 'recent' if isinstance(key.type, DateTime) else None)
+        if position is None:
+            raise ApiError("Curseur invalide")
+        value, last_id = position
+        if direction == 'desc':
+            filters.append(or_(key < value, and_(key == value, id_column < last_id)))
+        else:
+            filters.append(or_(key > value, and_(key == value, id_column > last_id)))
+
+    selected = [resource.columns[field] for field in fields if field in resource.columns]
+    statement = (select(id_column.label('_id'), key.label('_key'), *selected)
+                 .where(*filters)
+                 .order_by(key.desc() if direction == 'desc' else key.asc(),
+                           id_column.desc() if direction == 'desc' else id_column.asc())
+                 .limit(limit + 1))
+    rows = db.session.execute(statement).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]._key, rows[-1]._id)
+
+    names = _document_tags([row._id for row in rows]) if 'tags' in fields and rows else {}
+    # Position de chaque colonne dans les lignes, après _id et _key
+    positions = {field: index for index, field in enumerate(
+        (field for field in fields if field in resource.columns), start=2)}
+    if 'url' in fields:
+        # Les deux routes finissent par l'identifiant : un seul url_for par page
+        endpoint, argument = (('main.article', 'article_id') if name == 'articles'
+                              else ('main.download_document', 'document_id'))
+        url_prefix = url_for(endpoint, _external=True, **{argument: 0})[:-1]
+    data = []
+    for row in rows:
+        item = {}
+        for field in fields:
+            if field == 'tags':
+                item[field] = names.get(row._id, [])
+            elif field == 'url':
+                item[field] = f'{url_prefix}{row._id}'
+            else:
+                value = row[positions[field]]
+                item[field] = _iso(value) if isinstance(value, datetime) else value
+        data.append(item)
+
+    next_url = None
+    if next_cursor:
+        query = request.args.to_dict(flat=False)
+        query['cursor'] = [next_cursor]
+        next_url = url_for('main.api_list', resource=name, _external=True, **query)
+    return {'data': data, 'next_cursor': next_cursor, 'next': next_url}
+
+
+def api_response(name):
+    """Réponse JSON compacte, avec ETag (304 si le client a déjà cette page)"""
+    try:
+        payload, status = list_resource(name, request.args), 200
+    except ApiError as e:
+        payload, status = {'error': str(e)}, 400
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+    response = current_app.response_class(body, status=status, mimetype='application/json')
+    if status == 200:
+        response.add_etag()
+        response = response.make_conditional(request)
+    return response
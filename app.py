@@ -1,195 +1,365 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, make_response
+import click
+import collections
+from flask import Blueprint, Flask, current_app, render_template, request, redirect, url_for, flash, make_response
+from sqlalchemy import and_, event, inspect, or_
+from sqlalchemy.orm import load_only, lazyload, make_transient_to_detached
 import datetime
+import json
 import os
+import zipfile
 from dotenv import load_dotenv
+from jinja2 import FileSystemBytecodeCache
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from werkzeug.utils import secure_filename
-from models import db, Tag, Article, Document, User
+from models import db, Tag, Article, Document, DocumentText, User, recount_tags, fill_updated_dates, sqlite_engine_options, configure_sqlite
+from extraction import TextExtractor, pending_text
+from cache import PageCache, UserCache
+from feeds import Feeds
+from replicas import ReplicaRouting
+from assets import StaticAssets, build_assets
+from metrics import Metrics
+from compression import Compression, stream_page
+from logs import RequestLogging
+from transfer import export_data, import_data
+from rendering import render_article, render_articles, render_markdown
+from listing import list_documents, tag_facets, SORTS
+from api import api_response
+from tags import normalize_tag_names, parse_tag_names, resolve_tags, retag_documents
+from migrations import upgrade as upgrade_schema, pending_migrations, check_query_plans
+from ingest import ingest_documents, item_from_file, items_from_directory, items_from_uploads, items_from_zip, read_manifest, split_manifest
+from storage import store_upload, release, purge, migrate_legacy_files, migrate_storage, FileIndex, send_stored_file
+from backends import BACKENDS, Storage
+from search import search_entries, index_article, index_document, remove_from_index, ensure_search_index, rebuild_search_index
 from urllib.parse import urlparse
 import logging
 
-# Chargement des variables d'environnement
-load_dotenv()
-
 # Configuration des uploads
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx', 'txt'}
 
-# Initialisation de l'application Flask
-app = Flask(__name__)
+# Filtres de la liste des documents omis des URL quand ils ont leur valeur par défaut
+DOCUMENT_FILTER_DEFAULTS = {'match': 'all', 'sort': 'recent'}
 
-# Configuration des logs
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Configuration de la base de données
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///blog.db')
-if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres://'):
-    app.config['SQLALCHEMY_DATABASE_URI'] = app.config['SQLALCHEMY_DATABASE_URI'].replace('postgres://', 'postgresql://', 1)
-
-# Configuration du dossier d'upload
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-logger.info(f"Dossier d'upload configuré : {UPLOAD_FOLDER}")
-
-# Configuration des options de connexion PostgreSQL
-if 'postgresql' in app.config['SQLALCHEMY_DATABASE_URI']:
-    connect_args = {
-        'connect_timeout': 10,
-        'keepalives': 1,
-        'keepalives_idle': 30,
-        'keepalives_interval': 10,
-        'keepalives_count': 5,
-        'sslmode': 'require'
-    }
-    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-        'connect_args': connect_args,
-        'pool_pre_ping': True,
-        'pool_recycle': 300,
-        'pool_timeout': 20
-    }
+# Extensions, liées à l'application par create_app()
+request_logging = RequestLogging()
+login_manager = LoginManager()
+db_routing = ReplicaRouting()
+login_manager.login_view = 'main.login'
+text_extractor = TextExtractor()
+page_cache = PageCache()
+feeds = Feeds()
+user_cache = UserCache()
+static_assets = StaticAssets()
+file_storage = Storage()
+file_index = FileIndex()
+metrics = Metrics()
+compression = Compression()
 
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev_secret_key_123')
-app.config['SESSION_COOKIE_SECURE'] = True
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['PERMANENT_SESSION_LIFETIME'] = datetime.timedelta(minutes=60)
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+# Routes et commandes de maintenance (flask <commande>, sans préfixe)
+bp = Blueprint('main', __name__, cli_group=None)
 
-# Initialisation de la base de données et du login manager
-db.init_app(app)
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
 
+def create_app(config=None):
+    """Crée l'application. Aucun accès à la base ni au disque : le démarrage d'un worker reste immédiat."""
+    # Chargement des variables d'environnement
+    load_dotenv()
+
+    app = Flask(__name__)
+
+    # Configuration de la base de données
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///blog.db')
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres://'):
+        app.config['SQLALCHEMY_DATABASE_URI'] = app.config['SQLALCHEMY_DATABASE_URI'].replace('postgres://', 'postgresql://', 1)
+
+    # Configuration du dossier d'upload (créé à la première écriture)
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+
+    # Connexions gardées par engine et par worker : une par thread au moins (réglées par gunicorn.conf.py)
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', '5'))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', '10'))
+
+    # Configuration des options de connexion PostgreSQL
+    if 'postgresql' in app.config['SQLALCHEMY_DATABASE_URI']:
+        connect_args = {
+            'connect_timeout': 10,
+            'keepalives': 1,
+            'keepalives_idle': 30,
+            'keepalives_interval': 10,
+            'keepalives_count': 5,
+            'sslmode': 'require'
+        }
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'connect_args': connect_args,
+            'pool_pre_ping': True,
+            'pool_recycle': 300,
+            'pool_timeout': 20,
+            'pool_size': app.config['DB_POOL_SIZE'],
+            'max_overflow': app.config['DB_MAX_OVERFLOW']
+        }
+
+    # Profil SQLite (WAL, attente des verrous, cache) : voir models.configure_sqlite
+    app.config['SQLITE_PROFILE'] = os.environ.get('SQLITE_PROFILE', '1') == '1'
+    app.config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT', '5000'))  # ms
+    app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+    app.config['SQLITE_CACHE_SIZE'] = int(os.environ.get('SQLITE_CACHE_SIZE', '-65536'))  # négatif : en Kio
+
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev_secret_key_123')
+    app.config['SESSION_COOKIE_SECURE'] = True
+    app.config['SESSION_COOKIE_HTTPONLY'] = True
+    app.config['PERMANENT_SESSION_LIFETIME'] = datetime.timedelta(minutes=60)
+    app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+    app.config['ARTICLES_PER_PAGE'] = int(os.environ.get('ARTICLES_PER_PAGE', '10'))
+    app.config['SEARCH_RESULTS_PER_PAGE'] = int(os.environ.get('SEARCH_RESULTS_PER_PAGE', '20'))
+    app.config['DOCUMENTS_PER_PAGE'] = int(os.environ.get('DOCUMENTS_PER_PAGE', '50'))
+    # API JSON : taille de page par défaut et maximale (paramètre limit)
+    app.config['API_PAGE_SIZE'] = int(os.environ.get('API_PAGE_SIZE', '100'))
+    app.config['API_MAX_PAGE_SIZE'] = int(os.environ.get('API_MAX_PAGE_SIZE', '1000'))
+
+    # Import en masse : threads de hachage, documents par transaction, taille maximale d'un fichier d'archive
+    app.config['INGEST_WORKERS'] = int(os.environ.get('INGEST_WORKERS', '4'))
+    app.config['INGEST_BATCH_SIZE'] = int(os.environ.get('INGEST_BATCH_SIZE', '100'))
+    app.config['INGEST_MAX_FILE_SIZE'] = int(os.environ.get('INGEST_MAX_FILE_SIZE', str(200 * 1024 * 1024)))
+
+    # Téléchargements : '' (send_file), 'x-accel-redirect' (nginx) ou 'x-sendfile' (Apache)
+    app.config['DOWNLOAD_OFFLOAD'] = os.environ.get('DOWNLOAD_OFFLOAD', '').lower()
+    # Location nginx "internal" qui pointe vers UPLOAD_FOLDER
+    app.config['DOWNLOAD_ACCEL_PREFIX'] = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '/protected-uploads/')
+    app.config['DOWNLOAD_MAX_AGE'] = int(os.environ.get('DOWNLOAD_MAX_AGE', '3600'))
+    app.config['USE_X_SENDFILE'] = app.config['DOWNLOAD_OFFLOAD'] == 'x-sendfile'
+
+    # Templates compilés gardés sur disque, partagés entre workers et redémarrages
+    app.config['JINJA_CACHE_DIR'] = os.environ.get('JINJA_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+
+    if config:
+        app.config.update(config)
+
+    sqlite_profile = (app.config['SQLITE_PROFILE']
+                      and app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite')
+                      and 'SQLALCHEMY_ENGINE_OPTIONS' not in app.config)
+    if sqlite_profile:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
+
+    # Journalisation en premier : les messages suivants passent déjà par la file
+    request_logging.init_app(app)
+
+    if app.config['JINJA_CACHE_DIR']:
+        try:
+            os.makedirs(app.config['JINJA_CACHE_DIR'], exist_ok=True)
+            app.jinja_options = dict(app.jinja_options,
+                                     bytecode_cache=FileSystemBytecodeCache(app.config['JINJA_CACHE_DIR']))
+        except OSError as e:
+            logger.warning(f"Cache des templates désactivé : {str(e)}")
+
+    # Initialisation de la base de données et des extensions (réplicas d'abord : ce sont des binds)
+    db_routing.init_app(app)
+    db.init_app(app)
+    if sqlite_profile:
+        with app.app_context():
+            for engine in db.engines.values():
+                if engine.dialect.name == 'sqlite':
+                    configure_sqlite(engine, app.config)
+    login_manager.init_app(app)
+    text_extractor.init_app(app)
+    page_cache.init_app(app)
+    feeds.init_app(app)
+    user_cache.init_app(app)
+    static_assets.init_app(app)
+    file_storage.init_app(app)
+    file_index.init_app(app)
+    metrics.init_app(app)
+    compression.init_app(app)
+    app.register_blueprint(bp)
+    return app
+
+
+def warm_templates(app):
+    """Compile tous les templates, avant le fork des workers (preload_app)"""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+
+def load_user_snapshot(user_id):
+    """Copie détachée de l'utilisateur, partageable entre requêtes"""
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    snapshot = User(id=user.id, username=user.username, password_hash=user.password_hash)
+    make_transient_to_detached(snapshot)
+    return snapshot
+
+# Appelé seulement pour une session connectée : les visiteurs anonymes n'interrogent pas la base
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
-
-# Fonction utilitaire pour gérer les tags
-def get_or_create_tags(tag_names):
-    tags = []
-    for name in tag_names:
-        name = name.strip()
-        if name:
-            tag = Tag.query.filter_by(name=name).first()
-            if not tag:
-                tag = Tag(name=name)
-                db.session.add(tag)
-            tags.append(tag)
-    return tags
+    try:
+        return user_cache.get(int(user_id), load_user_snapshot)
+    except ValueError:
+        return None
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+@event.listens_for(User, 'after_update')
+def invalidate_cached_users(mapper, connection, user):
+    """Un changement de mot de passe ou de nom d'utilisateur vide le cache des utilisateurs"""
+    state = inspect(user)
+    if state.attrs.password_hash.history.has_changes() or state.attrs.username.history.has_changes():
+        user_cache.invalidate()
+
+@event.listens_for(User, 'after_delete')
+def forget_deleted_user(mapper, connection, user):
+    user_cache.invalidate()
 
-# Fonction pour migrer les fichiers
-def migrate_files():
+# Curseurs de pagination : "<date ISO>_<id>" du dernier élément affiché
+def encode_cursor(date, item_id):
+    return f"{date.isoformat()}_{item_id}"
+
+def decode_cursor(cursor):
     try:
-        # Récupérer tous les documents
-        documents = Document.query.all()
-        
-        # Pour chaque document
-        for document in documents:
-            old_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads', document.filename)
-            new_path = os.path.join(app.config['UPLOAD_FOLDER'], document.filename)
-            
-            # Si le fichier existe dans l'ancien dossier et pas dans le nouveau
-            if os.path.exists(old_path) and not os.path.exists(new_path):
-                try:
-                    # Copier le fichier
-                    os.makedirs(os.path.dirname(new_path), exist_ok=True)
-                    with open(old_path, 'rb') as src, open(new_path, 'wb') as dst:
-                        dst.write(src.read())
-                    app.logger.info(f"Fichier migré avec succès : {document.filename}")
-                except Exception as e:
-                    app.logger.error(f"Erreur lors de la migration du fichier {document.filename}: {str(e)}")
-    except Exception as e:
-        app.logger.error(f"Erreur lors de la migration des fichiers : {str(e)}")
+        date, item_id = cursor.rsplit('_', 1)
+        return datetime.datetime.fromisoformat(date), int(item_id)
+    except (AttributeError, ValueError):
+        return None
 
-# Appeler la migration au démarrage
-with app.app_context():
-    migrate_files()
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 # Route pour la page d'accueil
-@app.route('/')
+@bp.route('/')
+@page_cache.cached
+@db_routing.read_replica
 def home():
-    articles = Article.query.order_by(Article.created_date.desc()).all()
-    return render_template('home.html', articles=articles)
+    per_page = current_app.config['ARTICLES_PER_PAGE']
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+        page = 1
+    cursor = decode_cursor(request.args.get('before'))
+
+    # Le contenu complet n'est jamais chargé pour la liste
+    query = Article.query.options(
+        load_only(Article.id, Article.title, Article.excerpt, Article.created_date)
+    ).order_by(Article.created_date.desc(), Article.id.desc())
+
+    if cursor:
+        # Pagination par curseur sur (created_date, id)
+        created_date, article_id = cursor
+        query = query.filter(or_(
+            Article.created_date < created_date,
+            and_(Article.created_date == created_date, Article.id < article_id)
+        ))
+    elif page > 1:
+        # Lien direct vers une page sans curseur
+        query = query.offset((page - 1) * per_page)
+
+    # Une ligne de plus pour savoir s'il existe une page suivante
+    articles = query.limit(per_page + 1).all()
+    next_cursor = None
+    if len(articles) > per_page:
+        articles = articles[:per_page]
+        last = articles[-1]
+        next_cursor = encode_cursor(last.created_date, last.id)
+
+    return render_template('home.html', articles=articles, page=page, next_cursor=next_cursor)
 
 # Route pour afficher un article
-@app.route('/article/<int:article_id>')
+@bp.route('/article/<int:article_id>')
+@page_cache.cached
+@db_routing.read_replica
 def article(article_id):
     article = Article.query.get_or_404(article_id)
-    return render_template('article.html', article=article)
+    content_html = article.content_html
+    if content_html is None:
+        # Article antérieur au rendu à l'écriture : rendu pour cette réponse seulement, la lecture
+        # n'écrit pas en base (flask render-articles, lancé par build.sh, l'enregistre)
+        content_html = render_markdown(article.content)
+    return render_template('article.html', article=article, content_html=content_html)
+
+# Flux Atom et plan du site, régénérés seulement après une modification du contenu
+@bp.route('/feed.xml')
+@db_routing.read_replica
+def feed():
+    return feeds.response('feed')
+
+@bp.route('/sitemap.xml')
+@db_routing.read_replica
+def sitemap():
+    return feeds.response('sitemap')
+
+# API JSON en lecture seule : /api/v1/articles, /api/v1/documents, /api/v1/tags (voir api.py)
+@bp.route('/api/v1/<any(articles, documents, tags):resource>')
+@page_cache.cached
+@db_routing.read_replica
+def api_list(resource):
+    return api_response(resource)
 
 # Route pour la page de connexion
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     try:
-        app.logger.info("Début de la route login")
+        current_app.logger.debug("Début de la route login")
         
         # Vérification de l'authentification
         if current_user.is_authenticated:
-            app.logger.info("Utilisateur déjà connecté, redirection vers la page d'accueil")
-            return redirect(url_for('home'))
+            current_app.logger.debug("Utilisateur déjà connecté, redirection vers la page d'accueil")
+            return redirect(url_for('main.home'))
         
         # Traitement du formulaire
         if request.method == 'POST':
             username = request.form.get('username')
             password = request.form.get('password')
-            app.logger.info(f"Tentative de connexion pour l'utilisateur : {username}")
+            current_app.logger.info("Tentative de connexion pour l'utilisateur : %s", username)
             
             try:
                 # Recherche de l'utilisateur
                 user = User.query.filter_by(username=username).first()
-                app.logger.info(f"Recherche de l'utilisateur : {'trouvé' if user else 'non trouvé'}")
+                current_app.logger.debug("Recherche de l'utilisateur : %s", 'trouvé' if user else 'non trouvé')
                 
                 if user and user.check_password(password):
                     try:
                         # Tentative de connexion
                         login_user(user)
-                        app.logger.info(f"Connexion réussie pour l'utilisateur : {username}")
+                        current_app.logger.info("Connexion réussie pour l'utilisateur : %s", username)
                         flash('Connexion réussie !', 'success')
                         next_page = request.args.get('next')
-                        return redirect(next_page if next_page else url_for('home'))
+                        return redirect(next_page if next_page else url_for('main.home'))
                     except Exception as login_error:
-                        app.logger.error(f"Erreur lors du login_user : {str(login_error)}")
-                        app.logger.error(f"Type d'erreur : {type(login_error).__name__}")
+                        current_app.logger.error(f"Erreur lors du login_user : {str(login_error)}")
+                        current_app.logger.error(f"Type d'erreur : {type(login_error).__name__}")
                         raise
                 else:
-                    app.logger.warning(f"Échec de connexion pour l'utilisateur : {username}")
+                    current_app.logger.warning("Échec de connexion pour l'utilisateur : %s", username)
                     flash('Nom d\'utilisateur ou mot de passe incorrect', 'error')
             except Exception as db_error:
-                app.logger.error(f"Erreur lors de la requête base de données : {str(db_error)}")
-                app.logger.error(f"Type d'erreur : {type(db_error).__name__}")
+                current_app.logger.error(f"Erreur lors de la requête base de données : {str(db_error)}")
+                current_app.logger.error(f"Type d'erreur : {type(db_error).__name__}")
                 raise
         
         # Affichage du formulaire
-        app.logger.info("Affichage du formulaire de connexion")
+        current_app.logger.debug("Affichage du formulaire de connexion")
         try:
             return render_template('login.html')
         except Exception as template_error:
-            app.logger.error(f"Erreur lors du rendu du template : {str(template_error)}")
-            app.logger.error(f"Type d'erreur : {type(template_error).__name__}")
+            current_app.logger.error(f"Erreur lors du rendu du template : {str(template_error)}")
+            current_app.logger.error(f"Type d'erreur : {type(template_error).__name__}")
             raise
             
     except Exception as e:
-        app.logger.error(f"Erreur générale lors de la connexion : {str(e)}")
-        app.logger.error(f"Type d'erreur : {type(e).__name__}")
+        current_app.logger.error(f"Erreur générale lors de la connexion : {str(e)}")
+        current_app.logger.error(f"Type d'erreur : {type(e).__name__}")
         import traceback
-        app.logger.error(f"Traceback complet : {traceback.format_exc()}")
+        current_app.logger.error(f"Traceback complet : {traceback.format_exc()}")
         raise
 
 # Route pour la déconnexion
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('Vous avez été déconnecté', 'info')
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
 # Route pour créer un nouvel article
-@app.route('/admin/new', methods=['GET', 'POST'])
+@bp.route('/admin/new', methods=['GET', 'POST'])
 @login_required
 def new_article():
     if request.method == 'POST':
@@ -197,105 +367,126 @@ def new_article():
         content = request.form['content']
         
         article = Article(title=title, content=content)
+        render_article(article)
         db.session.add(article)
+        db.session.flush()
+        index_article(article)
         db.session.commit()
+        page_cache.invalidate()
         
         flash('Article créé avec succès!', 'success')
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     
     return render_template('new_article.html')
 
 # Route pour la modification d'un article
-@app.route('/admin/edit/<int:article_id>', methods=['GET', 'POST'])
+@bp.route('/admin/edit/<int:article_id>', methods=['GET', 'POST'])
 @login_required
 def edit_article(article_id):
     article = Article.query.get_or_404(article_id)
     if request.method == 'POST':
         article.title = request.form['title']
         article.content = request.form['content']
+        render_article(article)
+        index_article(article)
         db.session.commit()
+        page_cache.invalidate()
         flash('Article modifié avec succès!', 'success')
-        return redirect(url_for('article', article_id=article.id))
+        return redirect(url_for('main.article', article_id=article.id))
     return render_template('edit_article.html', article=article)
 
 # Route pour supprimer un article
-@app.route('/admin/delete/article/<int:article_id>', methods=['GET', 'POST'])
+@bp.route('/admin/delete/article/<int:article_id>', methods=['GET', 'POST'])
 @login_required
 def delete_article(article_id):
     article = Article.query.get_or_404(article_id)
+    remove_from_index('article', article.id)
     db.session.delete(article)
     db.session.commit()
+    page_cache.invalidate()
     flash('Article supprimé avec succès!', 'success')
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
 # Route pour la page des documents
-@app.route('/documents')
+@bp.route('/documents')
+@page_cache.cached
+@db_routing.read_replica
 def documents():
-    try:
-        # Récupérer le tag sélectionné depuis les paramètres de l'URL
-        selected_tag = request.args.get('tag')
-        
-        if selected_tag:
-            # Si un tag est sélectionné, filtrer les documents par ce tag
-            tag = Tag.query.filter_by(name=selected_tag).first()
-            if tag:
-                documents = tag.documents
-            else:
-                documents = []
-        else:
-            # Récupérer tous les documents si aucun tag n'est sélectionné
-            documents = Document.query.order_by(Document.upload_date.desc()).all()
-        
-        # Récupérer tous les tags pour le filtre
-        tags = Tag.query.order_by(Tag.name).all()
-        
-        return render_template('documents.html', 
-                             documents=documents, 
-                             tags=tags, 
-                             selected_tag=selected_tag)
-    except Exception as e:
-        app.logger.error(f"Erreur lors de l'affichage des documents : {str(e)}")
-        flash(str(e), 'error')
-        return render_template('documents.html', documents=[], tags=[], selected_tag=None)
+    # Filtres de l'URL : ?tag=a&tag=b&match=all|any&year=2023&author=x&sort=recent|year|title
+    filters = {
+        'tag': normalize_tag_names(request.args.getlist('tag')),
+        'match': 'any' if request.args.get('match') == 'any' else 'all',
+        'year': request.args.get('year', type=int),
+        'author': request.args.get('author', '').strip(),
+        'sort': request.args.get('sort') if request.args.get('sort') in SORTS else 'recent',
+    }
+    documents, next_cursor = list_documents(
+        tags=filters['tag'],
+        match=filters['match'],
+        year=filters['year'],
+        author=filters['author'],
+        sort=filters['sort'],
+        cursor=request.args.get('after'),
+        limit=current_app.config['DOCUMENTS_PER_PAGE']
+    )
+
+    def filter_url(toggle_tag=None, **changes):
+        """URL de la liste avec les filtres courants modifiés"""
+        args = dict(filters, **changes)
+        if toggle_tag:
+            tags = [name for name in args['tag'] if name != toggle_tag]
+            if toggle_tag not in args['tag']:
+                tags.append(toggle_tag)
+            args['tag'] = tags
+        # Les valeurs par défaut sont omises : URL courtes et cache mieux partagé
+        args = {key: value for key, value in args.items()
+                if value and value != DOCUMENT_FILTER_DEFAULTS.get(key)}
+        return url_for('main.documents', **args)
+    
+    # Envoyée pendant le rendu : le début du tableau part avant la dernière ligne
+    return stream_page('documents.html',
+                       documents=documents,
+                       tags=tag_facets(),
+                       filters=filters,
+                       filter_url=filter_url,
+                       next_cursor=next_cursor)
 
 # Route pour télécharger un document
-@app.route('/download/<int:document_id>')
+@bp.route('/download/<int:document_id>')
+@db_routing.read_replica
 def download_document(document_id):
     try:
-        logger.info(f"Tentative de téléchargement du document {document_id}")
-        document = Document.query.get_or_404(document_id)
+        logger.debug("Tentative de téléchargement du document %s", document_id)
+        # Seules les colonnes utiles : pas de chargement des tags
+        document = Document.query.options(
+            load_only(Document.filename, Document.original_filename, Document.file_hash),
+            lazyload(Document.tags)
+        ).filter_by(id=document_id).first_or_404()
         
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], document.filename)
-        logger.info(f"Chemin du fichier : {file_path}")
-        
-        if not os.path.exists(file_path):
-            logger.error(f"Fichier non trouvé : {file_path}")
-            # Liste tous les fichiers dans le dossier pour le debug
-            files = os.listdir(app.config['UPLOAD_FOLDER'])
-            logger.info(f"Fichiers dans le dossier : {files}")
+        if not file_index.exists(document.filename):
+            logger.error("Fichier non trouvé : %s", document.filename)
             flash("Le fichier n'existe pas sur le serveur.", 'error')
-            return redirect(url_for('documents'))
+            return redirect(url_for('main.documents'))
             
         try:
-            logger.info(f"Envoi du fichier : {document.original_filename}")
-            return send_from_directory(
-                app.config['UPLOAD_FOLDER'],
+            logger.info("Envoi du fichier : %s", document.original_filename)
+            return send_stored_file(
                 document.filename,
-                as_attachment=True,
-                download_name=document.original_filename
+                document.original_filename,
+                etag=document.file_hash
             )
         except Exception as e:
-            logger.error(f"Erreur lors de l'envoi du fichier : {str(e)}")
+            logger.error("Erreur lors de l'envoi du fichier : %s", e)
             flash("Erreur lors du téléchargement du fichier.", 'error')
-            return redirect(url_for('documents'))
+            return redirect(url_for('main.documents'))
             
     except Exception as e:
-        logger.error(f"Erreur lors du téléchargement : {str(e)}")
+        logger.error("Erreur lors du téléchargement : %s", e)
         flash("Une erreur s'est produite lors du téléchargement.", 'error')
-        return redirect(url_for('documents'))
+        return redirect(url_for('main.documents'))
 
 # Route pour uploader un document
-@app.route('/admin/upload', methods=['GET', 'POST'])
+@bp.route('/admin/upload', methods=['GET', 'POST'])
 @login_required
 def upload_document():
     if request.method == 'POST':
@@ -312,13 +503,10 @@ def upload_document():
             try:
                 # Sécurisation du nom de fichier
                 filename = secure_filename(file.filename)
-                # Ajout d'un timestamp pour éviter les doublons
-                filename = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
                 
-                # Sauvegarde du fichier
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                logger.info(f"Sauvegarde du fichier : {file_path}")
-                file.save(file_path)
+                # Écriture par blocs dans le stockage adressé par contenu (dédupliqué)
+                stored_path, file_hash, file_size = store_upload(file)
+                logger.info("Sauvegarde du fichier : %s (%d octets)", stored_path, file_size)
                 
                 # Création du document dans la base de données
                 title = request.form.get('title', filename)
@@ -327,37 +515,82 @@ def upload_document():
                 description = request.form.get('description', '')
                 
                 # Gestion des tags
-                tag_names = request.form.get('tags', '').split(',')
-                tags = get_or_create_tags(tag_names)
+                tags = resolve_tags(parse_tag_names(request.form.get('tags', '')))
                 
                 document = Document(
-                    filename=filename,
+                    filename=stored_path,
                     original_filename=file.filename,
+                    file_hash=file_hash,
+                    file_size=file_size,
                     title=title,
                     author=author,
                     year=year if year and year.isdigit() else None,
                     description=description,
                     tags=tags
                 )
+                document.extracted_text = pending_text(filename)
                 
                 db.session.add(document)
+                db.session.flush()
+                index_document(document)
                 db.session.commit()
-                logger.info(f"Document créé avec succès : {document.id}")
+                page_cache.invalidate()
+                logger.info("Document créé avec succès : %s", document.id)
+                
+                # Extraction du texte hors du thread de la requête
+                text_extractor.submit(document)
                 
                 flash('Document uploadé avec succès!', 'success')
-                return redirect(url_for('documents'))
+                return redirect(url_for('main.documents'))
             except Exception as e:
-                logger.error(f"Erreur lors de l'upload : {str(e)}")
+                db.session.rollback()
+                logger.error("Erreur lors de l'upload : %s", e)
                 flash("Une erreur s'est produite lors de l'upload.", 'error')
-                return redirect(url_for('documents'))
+                return redirect(url_for('main.documents'))
             
         flash('Type de fichier non autorisé', 'error')
         return redirect(request.url)
         
     return render_template('upload_document.html')
 
+# Route pour ajouter plusieurs documents à la fois (fichiers multiples ou archives ZIP)
+@bp.route('/admin/upload/bulk', methods=['GET', 'POST'])
+@login_required
+def bulk_upload_documents():
+    if request.method == 'POST':
+        try:
+            manifest, items = split_manifest(items_from_uploads(request.files.getlist('documents')))
+            manifest_file = request.files.get('manifest')
+            if manifest_file and manifest_file.filename:
+                manifest = read_manifest(manifest_file.stream, manifest_file.filename)
+        except (ValueError, KeyError, zipfile.BadZipFile) as e:
+            flash(f"Archive ou manifeste illisible : {e}", 'error')
+            return redirect(request.url)
+        if not items:
+            flash('Aucun fichier sélectionné', 'error')
+            return redirect(request.url)
+
+        report = ingest_documents(
+            items,
+            manifest=manifest,
+            allowed=allowed_file,
+            default_tags=parse_tag_names(request.form.get('tags', '')),
+            workers=current_app.config['INGEST_WORKERS'],
+            batch_size=current_app.config['INGEST_BATCH_SIZE'],
+            max_size=current_app.config['INGEST_MAX_FILE_SIZE'],
+        )
+        created = [result.document_id for result in report if result.status == 'created']
+        if created:
+            page_cache.invalidate()
+            for document in Document.query.filter(Document.id.in_(created)):
+                text_extractor.submit(document)
+        logger.info("Import en masse : %d fichiers, %d documents créés", len(report), len(created))
+        return render_template('bulk_upload.html', report=report, created=len(created))
+
+    return render_template('bulk_upload.html', report=None)
+
 # Route pour éditer un document
-@app.route('/admin/edit/document/<int:document_id>', methods=['GET', 'POST'])
+@bp.route('/admin/edit/document/<int:document_id>', methods=['GET', 'POST'])
 @login_required
 def edit_document(document_id):
     document = Document.query.get_or_404(document_id)
@@ -368,29 +601,372 @@ def edit_document(document_id):
         document.description = request.form.get('description', document.description)
         
         # Mise à jour des tags
-        tag_names = request.form.get('tags', '').split(',')
-        document.tags = get_or_create_tags(tag_names)
+        document.tags = resolve_tags(parse_tag_names(request.form.get('tags', '')))
+        index_document(document)
         
         db.session.commit()
+        page_cache.invalidate()
         flash('Document modifié avec succès!', 'success')
-        return redirect(url_for('documents'))
+        return redirect(url_for('main.documents'))
         
     return render_template('edit_document.html', document=document)
 
 # Route pour supprimer un document
-@app.route('/admin/delete/document/<int:document_id>', methods=['GET', 'POST'])
+@bp.route('/admin/delete/document/<int:document_id>', methods=['GET', 'POST'])
 @login_required
 def delete_document(document_id):
     document = Document.query.get_or_404(document_id)
     
     # Suppression de l'entrée dans la base de données
+    file_hash = document.file_hash
+    remove_from_index('document', document.id)
     db.session.delete(document)
+    db.session.flush()
+    unused = file_hash is not None and release(file_hash)
     db.session.commit()
+    page_cache.invalidate()
+    
+    # Le fichier n'est effacé qu'une fois plus aucun document ne le référence
+    if unused:
+        purge(file_hash)
     
     flash('Document supprimé avec succès!', 'success')
-    return redirect(url_for('documents'))
+    return redirect(url_for('main.documents'))
+
+# Route pour ajouter ou retirer des tags sur plusieurs documents à la fois
+@bp.route('/admin/documents/retag', methods=['POST'])
+@login_required
+def retag_documents_view():
+    document_ids = request.form.getlist('document_ids', type=int)
+    add = parse_tag_names(request.form.get('add_tags', ''))
+    remove = parse_tag_names(request.form.get('remove_tags', ''))
+    if not document_ids or not (add or remove):
+        flash('Sélectionnez des documents et des tags à ajouter ou retirer', 'error')
+        return redirect(url_for('main.documents'))
+    try:
+        for document in retag_documents(document_ids, add=add, remove=remove):
+            index_document(document)
+        db.session.commit()
+        page_cache.invalidate()
+        flash(f'Tags mis à jour sur {len(document_ids)} documents', 'success')
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Erreur lors du re-étiquetage : {str(e)}")
+        flash("Une erreur s'est produite lors de la mise à jour des tags.", 'error')
+    return redirect(url_for('main.documents'))
+
+# Route pour la recherche dans les articles et les documents
+@bp.route('/search')
+@db_routing.read_replica
+def search():
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('type')
+    results, next_cursor = [], None
+    if query:
+        try:
+            results, next_cursor = search_entries(
+                query,
+                kind=kind,
+                cursor=request.args.get('after'),
+                limit=current_app.config['SEARCH_RESULTS_PER_PAGE']
+            )
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Erreur lors de la recherche : {str(e)}")
+            flash("La recherche est momentanément indisponible.", 'error')
+    return render_template('search.html', query=query, kind=kind,
+                           results=results, next_cursor=next_cursor)
+
+@bp.cli.command('init-db')
+def init_db_command():
+    """Met le schéma à jour (tables, migrations, index de recherche), puis affiche le contenu de la base"""
+    for name in upgrade_schema():
+        print(f"Migration appliquée : {name}")
+    print("Tables :")
+    for table in db.metadata.tables.keys():
+        print(f"- {table}")
+    print(f"Articles : {Article.query.count()}, documents : {Document.query.count()}, "
+          f"tags : {Tag.query.count()}, utilisateurs : {User.query.count()}")
+
+@bp.cli.command('export')
+@click.argument('path', type=click.Path(dir_okay=False))
+@click.option('--batch-size', default=1000, show_default=True, help='Lignes lues par lot')
+def export_command(path, batch_size):
+    """Exporte la bibliothèque en JSONL (compressé si le nom finit par .gz)"""
+    counts = export_data(path, batch_size)
+    print(f"Export terminé dans {path} : " + ", ".join(f"{count} {name}" for name, count in counts.items()))
+
+@bp.cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=1000, show_default=True, help='Lignes insérées par requête')
+@click.option('--no-resume', is_flag=True, help='Ignore l\'avancement d\'un import interrompu')
+def import_command(path, batch_size, no_resume):
+    """Importe un export JSONL en conservant identifiants et tags ; relancer reprend l'import"""
+    # Schéma complet (version, index des migrations) avant les données, comme init-db
+    for name in upgrade_schema():
+        print(f"Migration appliquée : {name}")
+    try:
+        inserted = import_data(path, batch_size, resume=not no_resume)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    recount_tags()
+    # Exports antérieurs aux dates de modification de l'API
+    fill_updated_dates(db.session)
+    db.session.commit()
+    if any(inserted.values()):
+        print(f"Index de recherche reconstruit : {rebuild_search_index()} entrées")
+        page_cache.invalidate()
+    print("Import terminé : " + ", ".join(f"{count} {name}" for name, count in inserted.items()))
+
+@bp.cli.command('import-documents')
+@click.argument('sources', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('--manifest', type=click.Path(exists=True, dir_okay=False), help='Métadonnées en CSV ou JSON (filename, title, author, year, description, tags)')
+@click.option('--tag', 'tags', multiple=True, help='Tag ajouté à tous les documents (répétable)')
+@click.option('--workers', default=4, show_default=True, help='Threads de lecture et de hachage')
+@click.option('--batch-size', default=100, show_default=True, help='Documents enregistrés par transaction')
+@click.option('--include-existing', is_flag=True, help='Importe aussi les contenus déjà présents')
+@click.option('--report', type=click.Path(dir_okay=False), help='Rapport JSON par fichier')
+def import_documents_command(sources, manifest, tags, workers, batch_size, include_existing, report):
+    """Importe des fichiers, des archives ZIP ou des dossiers comme documents"""
+    items = []
+    for source in sources:
+        if os.path.isdir(source):
+            items.extend(items_from_directory(source))
+        elif source.lower().endswith('.zip'):
+            items.extend(items_from_zip(source))
+        else:
+            items.append(item_from_file(source))
+    found_manifest, items = split_manifest(items)
+    if manifest:
+        with open(manifest, 'rb') as f:
+            found_manifest = read_manifest(f, manifest)
+    results = ingest_documents(items, manifest=found_manifest, allowed=allowed_file,
+                               default_tags=normalize_tag_names(tags), workers=workers,
+                               batch_size=batch_size, skip_existing=not include_existing,
+                               max_size=current_app.config['INGEST_MAX_FILE_SIZE'])
+    counts = collections.Counter(result.status for result in results)
+    if counts['created']:
+        page_cache.invalidate()
+    for result in results:
+        if result.status in ('rejected', 'error'):
+            print(f"{result.status} : {result.name} ({result.message})")
+    if report:
+        with open(report, 'w', encoding='utf-8') as f:
+            json.dump([result._asdict() for result in results], f, indent=2, ensure_ascii=False)
+    print("Import terminé : " + ", ".join(f"{counts[status]} {status}"
+                                          for status in ('created', 'exists', 'rejected', 'error')))
+    if counts['created']:
+        print("Texte des nouveaux documents : flask extract-text")
+
+@bp.cli.command('render-articles')
+@click.option('--batch-size', default=200, show_default=True, help='Articles traités par lot')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True, help='Processus de rendu')
+@click.option('--all', 'force', is_flag=True, help='Rend aussi les articles déjà à jour')
+def render_articles_command(batch_size, workers, force):
+    """Rend le Markdown des articles en HTML (ceux rendus par une version antérieure du rendu)"""
+    count = render_articles(batch_size, workers, force)
+    if count:
+        page_cache.invalidate()
+    print(f"{count} articles rendus")
+
+@bp.cli.command('search-reindex')
+def search_reindex_command():
+    """Reconstruit l'index de recherche plein texte"""
+    count = rebuild_search_index()
+    print(f"Index de recherche reconstruit : {count} entrées")
+
+@bp.cli.command('extract-text')
+@click.option('--batch-size', default=20, show_default=True, help='Documents traités par lot')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True, help='Processus d\'extraction')
+@click.option('--timeout', type=int, help='Délai maximal par fichier, en secondes')
+@click.option('--retry-failed', is_flag=True, help='Retraite aussi les extractions en échec')
+def extract_text_command(batch_size, workers, timeout, retry_failed):
+    """Extrait le texte des documents existants, par lots et avec reprise"""
+    if timeout:
+        current_app.config['EXTRACTION_TIMEOUT'] = timeout
+    statuses = ['pending', 'failed'] if retry_failed else ['pending']
+    # Les lots déjà enregistrés ne sont plus sélectionnés : relancer la commande reprend le travail
+    last_id = 0
+    done = failed = 0
+    while True:
+        batch = (Document.query
+                 .outerjoin(DocumentText)
+                 .filter(Document.id > last_id)
+                 .filter(or_(DocumentText.document_id.is_(None), DocumentText.status.in_(statuses)))
+                 .order_by(Document.id)
+                 .limit(batch_size)
+                 .all())
+        if not batch:
+            break
+        last_id = batch[-1].id
+        for _, content, error in text_extractor.run_batch(current_app._get_current_object(), batch, workers):
+            if error:
+                failed += 1
+            else:
+                done += 1
+        db.session.commit()
+        print(f"Jusqu'au document {last_id} : {done} extraits, {failed} en échec")
+    text_extractor.shutdown()
+    print(f"Extraction terminée : {done} extraits, {failed} en échec")
+
+@bp.cli.group()
+def storage():
+    """Gestion du stockage des fichiers"""
+
+@storage.command('migrate-legacy')
+@click.option('--batch-size', default=100, show_default=True)
+def storage_migrate_legacy_command(batch_size):
+    """Range uploads/ et les blobs file_content dans le stockage adressé par contenu"""
+    migrated, missing = migrate_legacy_files(batch_size)
+    print(f"Stockage : {migrated} documents migrés, {missing} fichiers introuvables")
+
+@storage.command('migrate')
+@click.option('--from', 'source', type=click.Choice(BACKENDS), help='Backend source (STORAGE_BACKEND par défaut)')
+@click.option('--to', 'target', type=click.Choice(BACKENDS), required=True, help='Backend cible')
+@click.option('--workers', default=8, show_default=True, help='Copies en parallèle')
+@click.option('--batch-size', default=500, show_default=True, help='Contenus lus par requête')
+@click.option('--delete-source', is_flag=True, help='Supprime chaque contenu de la source une fois copié')
+def storage_migrate_command(source, target, workers, batch_size, delete_source):
+    """Copie les fichiers d'un backend de stockage à l'autre (relançable)"""
+    source = source or current_app.config['STORAGE_BACKEND']
+    if source == target:
+        raise click.ClickException("La source et la cible sont le même backend")
+    counts = migrate_storage(source, target, workers, batch_size, delete_source)
+    print("Migration terminée : " + ", ".join(f"{count} {status}" for status, count in counts.items()))
+    if not counts['missing'] and not counts['error'] and target != current_app.config['STORAGE_BACKEND']:
+        print(f"Pour utiliser le nouveau stockage : STORAGE_BACKEND={target}")
+
+@bp.cli.group()
+def schema():
+    """Migrations du schéma de la base"""
+
+@schema.command('upgrade')
+def schema_upgrade_command():
+    """Crée les tables manquantes et applique les migrations en attente (relançable)"""
+    applied = upgrade_schema()
+    for name in applied:
+        print(f"Migration appliquée : {name}")
+    print("Schéma à jour" if applied else "Aucune migration en attente")
+
+@schema.command('status')
+def schema_status_command():
+    """Liste les migrations en attente"""
+    pending = pending_migrations()
+    for version, name in pending:
+        print(f"En attente : {version} {name}")
+    print(f"{len(pending)} migration(s) en attente")
+
+@schema.command('check-plans')
+@click.option('--verbose', is_flag=True, help='Affiche les plans complets')
+def schema_check_plans_command(verbose):
+    """Vérifie que les requêtes des listes utilisent leurs index (sur une base remplie, voir bench seed)"""
+    results = check_query_plans()
+    for result in results:
+        status = {True: 'OK', False: 'ÉCHEC', None: 'ignoré'}[result['ok']]
+        print(f"{status:7} {result['name']} ({result['url']})" +
+              (f" : {', '.join(result['problems'])}" if result['problems'] else ''))
+        if verbose and result['plan']:
+            print('        ' + result['plan'].replace('\n', '\n        '))
+    if any(result['ok'] is False for result in results):
+        raise SystemExit(1)
+
+@bp.cli.command('recount-tags')
+def recount_tags_command():
+    """Recalcule le nombre de documents de chaque tag"""
+    recount_tags()
+    db.session.commit()
+    print("Compteurs de tags recalculés")
+
+@bp.cli.command('build-assets')
+def build_assets_command():
+    """Génère les fichiers statiques hashés et précompressés (static/dist)"""
+    manifest = build_assets(current_app.static_folder)
+    static_assets.load_manifest(current_app)
+    print(f"{len(manifest)} fichiers statiques générés dans static/dist")
+
+# Le module benchmark (générateur de charge, lancement de gunicorn) n'est importé que par ces commandes,
+# jamais par les workers
+@bp.cli.group()
+def bench():
+    """Banc d'essai : corpus synthétique et générateur de charge"""
+
+@bench.command('seed')
+@click.option('--scale', default='1k', show_default=True, help="Nombre de documents (1k, 10k, 100k ou un entier)")
+@click.option('--seed', default=42, show_default=True, help='Graine du générateur')
+@click.option('--reset', is_flag=True, help='Vide la base avant de la remplir')
+@click.option('--password', default='bench', show_default=True, help='Mot de passe du compte bench')
+def bench_seed_command(scale, seed, reset, password):
+    """Remplit la base avec un corpus synthétique reproductible"""
+    from benchmark import seed_corpus
+    if reset:
+        click.confirm('Toutes les données de la base seront supprimées. Continuer ?', abort=True)
+        db.drop_all()
+        db.session.execute(db.text('DROP TABLE IF EXISTS search_index'))
+        db.session.commit()
+        db.create_all()
+    counts = seed_corpus(scale, seed, password)
+    print("Corpus généré : " + ", ".join(f"{count} {name}" for name, count in counts.items()))
+
+@bench.command('run')
+@click.option('--url', help='Serveur à tester (par défaut, requêtes directes sur l\'application)')
+@click.option('--duration', default=30.0, show_default=True, help='Durée de la mesure, en secondes')
+@click.option('--requests', 'total', type=int, help='Nombre total de requêtes (remplace --duration)')
+@click.option('--concurrency', default=4, show_default=True, help='Clients simultanés')
+@click.option('--warmup', default=20, show_default=True, help='Requêtes d\'échauffement non mesurées')
+@click.option('--seed', default=42, show_default=True)
+@click.option('--password', default='bench', show_default=True, help='Mot de passe du compte bench')
+@click.option('--output', type=click.Path(dir_okay=False), help='Fichier JSON de résultats (sinon sortie standard)')
+def bench_run_command(url, duration, total, concurrency, warmup, seed, password, output):
+    """Mesure débit et latences (p50/p95/p99) et les écrit en JSON"""
+    from benchmark import run_load
+    results = run_load(current_app._get_current_object(), url=url, duration=duration, requests=total, concurrency=concurrency,
+                       warmup=warmup, seed=seed, password=password)
+    report = json.dumps(results, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(report + '\n')
+        print(f"{results['requests']} requêtes, {results['throughput_rps']} req/s, "
+              f"p95 {results['latency_ms']['p95']} ms : résultats dans {output}")
+    else:
+        print(report)
+
+@bench.command('stress')
+@click.option('--database', type=click.Path(dir_okay=False), help='Fichier SQLite de test (par défaut, un fichier temporaire)')
+@click.option('--duration', default=10.0, show_default=True, help='Durée, en secondes')
+@click.option('--writers', default=4, show_default=True, help='Processus qui écrivent')
+@click.option('--readers', default=8, show_default=True, help='Processus qui lisent')
+@click.option('--no-profile', is_flag=True, help='Sans le profil SQLite (WAL, busy_timeout), pour comparer')
+def bench_stress_command(database, duration, writers, readers, no_profile):
+    """Lectures et écritures simultanées sur SQLite : échoue en cas d'erreur de verrou"""
+    from benchmark import run_stress
+    results = run_stress(database, duration=duration, writers=writers, readers=readers, profile=not no_profile)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    if results['lock_errors']:
+        raise SystemExit(1)
+
+@bench.command('slow-clients')
+@click.option('--url', help='Serveur déjà lancé à tester (par défaut, gunicorn lancé dans chaque mode de --modes)')
+@click.option('--modes', default='sync,gthread', show_default=True, help='Modes de worker gunicorn comparés')
+@click.option('--workers', default=2, show_default=True, help='Workers gunicorn, identiques dans chaque mode')
+@click.option('--threads', default=8, show_default=True, help='Threads par worker (gthread)')
+@click.option('--slow', default=8, show_default=True, help='Clients lents simultanés')
+@click.option('--concurrency', default=4, show_default=True, help='Clients normaux simultanés')
+@click.option('--duration', default=10.0, show_default=True, help='Durée de la mesure, en secondes')
+def bench_slow_clients_command(url, modes, workers, threads, slow, concurrency, duration):
+    """Débit des clients normaux pendant que des clients lents envoient leurs requêtes au compte-gouttes"""
+    from benchmark import compare_workers, run_slow_clients
+    options = {'slow': slow, 'concurrency': concurrency, 'duration': duration}
+    if url:
+        results = run_slow_clients(url, **options)
+    else:
+        try:
+            results = compare_workers([mode.strip() for mode in modes.split(',') if mode.strip()],
+                                      workers=workers, threads=threads, **options)
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+    print(json.dumps(results, indent=2, ensure_ascii=False))
 
-@app.after_request
+@bp.after_app_request
 def add_no_cache_headers(response):
     """Ajoute les en-têtes pour désactiver le cache sur les réponses HTTP"""
     if 'Cache-Control' not in response.headers:
@@ -399,7 +975,7 @@ def add_no_cache_headers(response):
 
 if __name__ == '__main__':
     # Configuration pour le développement local
-    app.run(
+    create_app().run(
         host='127.0.0.1',     # N'écoute que les connexions locales
         port=8000,            # Utilisation du port 8000 pour éviter les conflits
         debug=True,           # Mode debug pour voir les erreurs
@@ -0,0 +1,123 @@
+"""Fichiers statiques avec empreinte de contenu et variantes précompressées.
+
+La commande flask build-assets copie chaque fichier de static/ sous
+static/dist/ avec le hash de son contenu dans le nom, produit les variantes
+.gz et .br, puis écrit le manifeste. url_for('static') renvoie ensuite les
+URL hashées, servies avec un cache navigateur d'un an.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # Les variantes .br sont simplement omises
+    brotli = None
+
+DIST_FOLDER = 'dist'
+MANIFEST_NAME = 'manifest.json'
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.map'}
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Par ordre de préférence
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def build_assets(static_folder):
+    """Génère static/dist et son manifeste. Retourne le manifeste."""
+    dist_folder = os.path.join(static_folder, DIST_FOLDER)
+    shutil.rmtree(dist_folder, ignore_errors=True)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        if os.path.abspath(root) == os.path.abspath(static_folder) and DIST_FOLDER in dirs:
+            dirs.remove(DIST_FOLDER)
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            relative = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            stem, extension = os.path.splitext(relative)
+            hashed = f"{DIST_FOLDER}/{stem}.{_file_hash(source)}{extension}"
+            target = os.path.join(static_folder, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+
+            if extension in COMPRESSIBLE_EXTENSIONS:
+                with open(source, 'rb') as f:
+                    data = f.read()
+                # mtime=0 : sortie identique d'un build à l'autre
+                with open(target + '.gz', 'wb') as f:
+                    f.write(gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    with open(target + '.br', 'wb') as f:
+                        f.write(brotli.compress(data, quality=11))
+            manifest[relative] = hashed
+
+    with open(os.path.join(dist_folder, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class StaticAssets:
+    """Réécrit url_for('static') selon le manifeste et sert les fichiers hashés"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['static_assets'] = self
+        self.load_manifest(app)
+        app.url_defaults(self._hashed_url)
+        app.view_functions['static'] = self.send_static
+
+    def load_manifest(self, app):
+        path = os.path.join(app.static_folder, DIST_FOLDER, MANIFEST_NAME)
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            # Pas de build : les fichiers d'origine sont servis tels quels
+            manifest = {}
+        # Variantes précompressées disponibles pour chaque fichier hashé
+        encodings = {}
+        for hashed in manifest.values():
+            base = os.path.join(app.static_folder, hashed)
+            encodings[hashed] = [encoding for encoding, extension in ENCODINGS
+                                 if os.path.exists(base + extension)]
+        # Propres à chaque application, remplacés d'un bloc (build-assets sur une application en service)
+        app.extensions['static_assets_manifest'] = (manifest, encodings)
+
+    def _hashed_url(self, endpoint, values):
+        manifest, _ = current_app.extensions['static_assets_manifest']
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    def send_static(self, filename):
+        _, encodings = current_app.extensions['static_assets_manifest']
+        if filename not in encodings:
+            return current_app.send_static_file(filename)
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        path, encoding = filename, None
+        for candidate, extension in ENCODINGS:
+            if candidate in encodings[filename] and candidate in request.accept_encodings:
+                path, encoding = filename + extension, candidate
+                break
+
+        response = send_from_directory(current_app.static_folder, path, mimetype=mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
@@ -0,0 +1,361 @@
+"""Backends du stockage des fichiers : disque local, base de données ou S3.
+
+Les fichiers sont désignés par leur clé, le chemin relatif du stockage
+adressé par contenu (objects/<aa>/<bb>/<sha256>). STORAGE_BACKEND choisit
+où ils sont gardés :
+
+- fs : sous UPLOAD_FOLDER (un disque partagé si plusieurs machines)
+- db : dans la table blob_chunk, par morceaux de STORAGE_DB_CHUNK_SIZE
+- s3 : dans un bucket S3 ou compatible (MinIO, moto...), via boto3
+
+Devant un backend distant, un cache local borné (STORAGE_CACHE_DIR,
+STORAGE_CACHE_MAX_SIZE) garde les fichiers récemment lus : les
+téléchargements et l'extraction de texte travaillent toujours sur un
+fichier local, et les nœuds de l'application n'ont rien à partager.
+"""
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from flask import current_app
+from sqlalchemy import delete, insert, select
+
+from models import db, BlobChunk
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # Le backend s3 est alors indisponible
+    boto3 = None
+
+BACKENDS = ('fs', 'db', 's3')
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class FilesystemBackend:
+    """Fichiers sous un dossier local"""
+
+    remote = False
+
+    def __init__(self, root):
+        self.root = root
+
+    def local_path(self, key):
+        return os.path.join(self.root, key)
+
+    def exists(self, key):
+        return os.path.isfile(self.local_path(key))
+
+    def put(self, key, path):
+        """Déplace le fichier à sa place (un contenu déjà présent n'est pas réécrit)"""
+        target = self.local_path(key)
+        if os.path.exists(target):
+            os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+
+    def read_chunks(self, key):
+        with open(self.local_path(key), 'rb') as f:
+            yield from iter(lambda: f.read(READ_CHUNK_SIZE), b'')
+
+    def delete(self, key):
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+
+class DatabaseBackend:
+    """Fichiers dans la table blob_chunk, un morceau par ligne.
+
+    Les écritures passent par la transaction de la session, comme la
+    référence StoredFile qui les accompagne : l'appelant commit, et un
+    rollback n'y laisse pas de fichier orphelin.
+    """
+
+    remote = True
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+
+    def local_path(self, key):
+        return None
+
+    def exists(self, key):
+        return db.session.execute(
+            select(BlobChunk.seq).where(BlobChunk.key == key, BlobChunk.seq == 0)).first() is not None
+
+    def put(self, key, path):
+        """Copie le fichier en base ; il reste en place (voir Storage.put)"""
+        if self.exists(key):
+            return
+        with open(path, 'rb') as f:
+            for seq, data in enumerate(iter(lambda: f.read(self.chunk_size), b'')):
+                db.session.execute(insert(BlobChunk).values(key=key, seq=seq, data=data))
+            if f.tell() == 0:
+                # Fichier vide : une ligne quand même, pour exists()
+                db.session.execute(insert(BlobChunk).values(key=key, seq=0, data=b''))
+
+    def read_chunks(self, key):
+        statement = select(BlobChunk.data).where(BlobChunk.key == key)
+        seq = 0
+        while True:
+            # Un morceau par requête : la mémoire reste bornée quelle que soit la taille
+            data = db.session.execute(statement.where(BlobChunk.seq == seq)).scalar()
+            if data is None:
+                if seq == 0:
+                    raise FileNotFoundError(key)
+                return
+            yield bytes(data)
+            seq += 1
+
+    def delete(self, key):
+        db.session.execute(delete(BlobChunk).where(BlobChunk.key == key))
+
+
+class S3Backend:
+    """Fichiers dans un bucket S3 (endpoint_url pour MinIO ou un serveur de test)"""
+
+    remote = True
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, max_connections=10):
+        if boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND=s3 nécessite boto3 (pip install boto3)")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 nécessite STORAGE_S3_BUCKET")
+        self.bucket = bucket
+        self.prefix = prefix
+        # Identifiants : variables AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY ou configuration boto3 habituelle
+        self.client = boto3.client('s3', endpoint_url=endpoint_url or None, region_name=region or None,
+                                   config=BotoConfig(max_pool_connections=max_connections,
+                                                     retries={'max_attempts': 3, 'mode': 'standard'}))
+
+    def local_path(self, key):
+        return None
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def put(self, key, path):
+        """Envoie le fichier (en plusieurs parties s'il est gros) ; il reste en place"""
+        if not self.exists(key):
+            self.client.upload_file(path, self.bucket, self.prefix + key)
+
+    def read_chunks(self, key):
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)['Body']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                raise FileNotFoundError(key)
+            raise
+        try:
+            yield from body.iter_chunks(READ_CHUNK_SIZE)
+        finally:
+            body.close()
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+
+class LocalCache:
+    """Cache disque borné des fichiers d'un backend distant, partagé par les workers.
+
+    La date de modification d'un fichier sert de date de dernier accès :
+    au-delà de max_size, les fichiers les moins récemment lus sont supprimés.
+    Chaque processus estime la taille du cache et ne parcourt le dossier que
+    lorsque son estimation dépasse la limite.
+    """
+
+    # Un accès ne repousse la date d'un fichier qu'au-delà de cet intervalle (secondes)
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, folder, max_size):
+        self.folder = folder
+        self.max_size = max_size
+        self._size = None
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.folder, key)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        now = time.time()
+        if now - mtime > self.TOUCH_INTERVAL:
+            try:
+                os.utime(path, (now, now))
+            except FileNotFoundError:
+                # Évincé entre-temps par un autre worker
+                return None
+        return path
+
+    def fill(self, key, chunks):
+        """Écrit un fichier lu du backend. Retourne son chemin."""
+        tmp_folder = os.path.join(self.folder, 'tmp')
+        os.makedirs(tmp_folder, exist_ok=True)
+        tmp_path = os.path.join(tmp_folder, uuid.uuid4().hex)
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return self.adopt(key, tmp_path)
+
+    def adopt(self, key, path):
+        """Range un fichier local (déplacé) dans le cache. Retourne son nouveau chemin."""
+        target = self.path(key)
+        size = os.path.getsize(path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(path, target)
+        self._added(size)
+        return target
+
+    def discard(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def _added(self, size):
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan()[0]
+            else:
+                self._size += size
+            if self._size <= self.max_size:
+                return
+            self._size = self._evict()
+
+    def _scan(self):
+        files = []
+        total = 0
+        for root, dirs, names in os.walk(self.folder):
+            dirs[:] = [d for d in dirs if d != 'tmp']
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        return total, files
+
+    def _evict(self):
+        """Supprime les fichiers les moins récemment lus jusqu'à 90 % de max_size. Retourne la taille restante."""
+        total, files = self._scan()
+        target = self.max_size * 0.9
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+
+def make_backend(name, config):
+    if name == 'fs':
+        return FilesystemBackend(config['STORAGE_FS_ROOT'] or config['UPLOAD_FOLDER'])
+    if name == 'db':
+        return DatabaseBackend(config['STORAGE_DB_CHUNK_SIZE'])
+    if name == 's3':
+        return S3Backend(config['STORAGE_S3_BUCKET'], config['STORAGE_S3_PREFIX'],
+                         config['STORAGE_S3_ENDPOINT_URL'], config['STORAGE_S3_REGION'],
+                         config['STORAGE_S3_MAX_CONNECTIONS'])
+    raise ValueError(f"Backend de stockage inconnu : {name} (disponibles : {', '.join(BACKENDS)})")
+
+
+class Storage:
+    """Backend configuré (STORAGE_BACKEND), avec le cache local devant un backend distant"""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """À appeler après la configuration de UPLOAD_FOLDER. Aucune connexion avant le premier accès."""
+        app.config.setdefault('STORAGE_BACKEND', os.environ.get('STORAGE_BACKEND', 'fs'))
+        app.config.setdefault('STORAGE_FS_ROOT', os.environ.get('STORAGE_FS_ROOT', ''))
+        app.config.setdefault('STORAGE_DB_CHUNK_SIZE', int(os.environ.get('STORAGE_DB_CHUNK_SIZE', str(1024 * 1024))))
+        app.config.setdefault('STORAGE_S3_BUCKET', os.environ.get('STORAGE_S3_BUCKET', ''))
+        app.config.setdefault('STORAGE_S3_PREFIX', os.environ.get('STORAGE_S3_PREFIX', ''))
+        app.config.setdefault('STORAGE_S3_ENDPOINT_URL', os.environ.get('STORAGE_S3_ENDPOINT_URL', ''))
+        app.config.setdefault('STORAGE_S3_REGION', os.environ.get('STORAGE_S3_REGION', ''))
+        app.config.setdefault('STORAGE_S3_MAX_CONNECTIONS', int(os.environ.get('STORAGE_S3_MAX_CONNECTIONS', '10')))
+        # Dans UPLOAD_FOLDER par défaut : X-Accel-Redirect sert aussi les fichiers en cache
+        app.config.setdefault('STORAGE_CACHE_DIR', os.environ.get(
+            'STORAGE_CACHE_DIR', os.path.join(app.config['UPLOAD_FOLDER'], 'cache')))
+        app.config.setdefault('STORAGE_CACHE_MAX_SIZE', int(os.environ.get(
+            'STORAGE_CACHE_MAX_SIZE', str(1024 * 1024 * 1024))))
+        if app.config['STORAGE_BACKEND'] not in BACKENDS:
+            raise ValueError(f"STORAGE_BACKEND inconnu : {app.config['STORAGE_BACKEND']}")
+        app.extensions['storage'] = self
+        # Backends créés au premier usage et cache local, propres à l'application
+        app.extensions['storage_backends'] = {}
+
+    def backend(self, name=None):
+        """Backend nommé (celui de STORAGE_BACKEND par défaut), créé au premier usage"""
+        config = current_app.config
+        name = name or config['STORAGE_BACKEND']
+        backends = current_app.extensions['storage_backends']
+        with self._lock:
+            if name not in backends:
+                backends[name] = make_backend(name, config)
+            return backends[name]
+
+    @property
+    def cache(self):
+        backends = current_app.extensions['storage_backends']
+        with self._lock:
+            if 'cache' not in backends:
+                backends['cache'] = LocalCache(current_app.config['STORAGE_CACHE_DIR'],
+                                               current_app.config['STORAGE_CACHE_MAX_SIZE'])
+            return backends['cache']
+
+    def exists(self, key):
+        backend = self.backend()
+        if backend.remote and self.cache.get(key):
+            return True
+        return backend.exists(key)
+
+    def put(self, key, path):
+        """Range un fichier temporaire local, qui est déplacé ou supprimé"""
+        backend = self.backend()
+        backend.put(key, path)
+        if backend.remote:
+            # Fichier tout juste envoyé : il sera sans doute lu bientôt (extraction, téléchargement)
+            self.cache.adopt(key, path)
+
+    def local_path(self, key):
+        """Chemin d'un fichier lisible localement, téléchargé dans le cache si besoin"""
+        backend = self.backend()
+        if not backend.remote:
+            return backend.local_path(key)
+        return self.cache.get(key) or self.cache.fill(key, backend.read_chunks(key))
+
+    def delete(self, key):
+        backend = self.backend()
+        backend.delete(key)
+        if backend.remote:
+            self.cache.discard(key)
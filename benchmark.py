@@ -0,0 +1,574 @@
+"""Banc d'essai : corpus synthétique reproductible et générateur de charge.
+
+seed_corpus() remplit Article, Document, Tag et document_tags à une échelle
+donnée (1k, 10k, 100k documents) à partir d'une graine : deux bases générées
+avec la même graine sont identiques. Les tags suivent une loi de Zipf, comme
+un vrai corpus où quelques thèmes dominent.
+
+run_stress() vérifie qu'une base SQLite supporte des écritures et lectures
+simultanées depuis plusieurs processus (comme des workers gunicorn) sans
+erreur « database is locked ».
+
+run_load() rejoue un mélange de requêtes (accueil, article, documents filtrés
+par tag, téléchargement, connexion) soit directement sur l'application, soit
+sur un serveur lancé à part (--url), et retourne débit et latences
+p50/p95/p99 dans un dictionnaire prêt à être écrit en JSON.
+
+run_slow_clients() mesure le débit de clients normaux pendant que d'autres
+envoient leur requête au compte-gouttes ; compare_workers() lance gunicorn
+dans chaque mode (sync, gthread) et y rejoue cette mesure.
+"""
+import datetime
+import http.client
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote, urlencode, urlparse
+
+import click
+from sqlalchemy import func, insert, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import load_only
+
+from models import db, Article, Document, StoredFile, Tag, User, document_tags, recount_tags
+from rendering import rendered_fields
+from storage import store_chunks
+
+SCALES = {'1k': 1_000, '10k': 10_000, '100k': 100_000}
+# Articles générés par document
+ARTICLE_RATIO = 0.25
+INSERT_BATCH_SIZE = 5000
+# Contenus distincts partagés par les documents (stockage dédupliqué)
+FILE_POOL_SIZE = 32
+FILE_SIZES = (4 * 1024, 64 * 1024, 512 * 1024, 2 * 1024 * 1024)
+BASE_DATE = datetime.datetime(2020, 1, 1)
+BENCH_USERNAME = 'bench'
+# Clients lents : taille du formulaire envoyé octet par octet, pages lues par les clients normaux
+SLOW_BODY_SIZE = 4096
+SLOW_CLIENT_PATHS = ('/', '/documents', '/api/v1/documents?limit=20')
+
+# Poids des scénarios du générateur de charge
+SCENARIOS = {
+    'home': 30,
+    'article': 25,
+    'documents_tag': 20,
+    'download': 15,
+    'login': 10,
+}
+
+WORDS = (
+    "climat carbone émissions réchauffement océan glacier biodiversité énergie "
+    "renouvelable solaire éolien sécheresse inondation forêt agriculture eau "
+    "température atmosphère adaptation atténuation transition politique GIEC "
+    "rapport scénario modèle données mesure région ville transport bâtiment "
+    "méthane sol littoral montagne risque santé économie justice accord"
+).split()
+
+
+def _sentence(rng, length):
+    words = [rng.choice(WORDS) for _ in range(length)]
+    return ' '.join(words).capitalize()
+
+
+def _paragraphs(rng, count):
+    return '\n\n'.join(
+        '. '.join(_sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(3, 6))) + '.'
+        for _ in range(count)
+    )
+
+
+def _zipf_weights(count, exponent=1.1):
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def _batches(rows, size=INSERT_BATCH_SIZE):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _store_file_pool(rng):
+    """Crée les fichiers factices dans UPLOAD_FOLDER. Retourne [(sha256, chemin, taille)]."""
+    pool = []
+    for index in range(FILE_POOL_SIZE):
+        size = FILE_SIZES[index % len(FILE_SIZES)]
+        block = rng.randbytes(min(size, 64 * 1024))
+        chunks = (block[:size - offset] for offset in range(0, size, len(block)))
+        path, sha256, size = store_chunks(chunks)
+        pool.append((sha256, path, size))
+    # store_chunks compte une référence : les vraies sont fixées après coup
+    return pool
+
+
+def seed_corpus(scale, seed=42, password='bench'):
+    """Remplit une base vide. Retourne le nombre de lignes créées par table."""
+    from search import rebuild_search_index
+
+    documents_count = SCALES.get(scale) or int(scale)
+    articles_count = max(10, int(documents_count * ARTICLE_RATIO))
+    tags_count = max(20, documents_count // 50)
+    rng = random.Random(seed)
+
+    if db.session.query(Document.id).first() or db.session.query(Article.id).first():
+        raise click.ClickException("La base contient déjà des données : utilisez une base vide ou --reset")
+
+    tag_names = [f"{rng.choice(WORDS)} {index}" for index in range(tags_count)]
+    db.session.execute(insert(Tag), [{'name': name} for name in tag_names])
+    tag_ids = [tag_id for tag_id, in db.session.query(Tag.id).order_by(Tag.id)]
+    weights = _zipf_weights(tags_count)
+
+    span = int((datetime.datetime(2025, 1, 1) - BASE_DATE).total_seconds())
+    articles = []
+    for index in range(articles_count):
+        content = _paragraphs(rng, rng.randint(2, 8))
+        articles.append({
+            'title': _sentence(rng, rng.randint(4, 10)),
+            'content': content,
+            'created_date': BASE_DATE + datetime.timedelta(seconds=rng.randrange(span)),
+            **rendered_fields(content),
+        })
+    for batch in _batches(articles):
+        db.session.execute(insert(Article), batch)
+
+    pool = _store_file_pool(rng)
+    references = defaultdict(int)
+    documents = []
+    for index in range(documents_count):
+        sha256, path, size = rng.choice(pool)
+        references[sha256] += 1
+        documents.append({
+            'filename': path,
+            'original_filename': f"document-{index}.pdf",
+            'title': _sentence(rng, rng.randint(3, 12)),
+            'author': f"{rng.choice(WORDS).capitalize()} {rng.choice(WORDS).capitalize()}",
+            'year': rng.randint(1990, 2024) if rng.random() < 0.9 else None,
+            'description': _sentence(rng, rng.randint(10, 40)),
+            'upload_date': BASE_DATE + datetime.timedelta(seconds=rng.randrange(span)),
+            'file_hash': sha256,
+            'file_size': size,
+        })
+    for batch in _batches(documents):
+        db.session.execute(insert(Document), batch)
+    for sha256, _, _ in pool:
+        db.session.execute(update(StoredFile).where(StoredFile.sha256 == sha256)
+                           .values(ref_count=references[sha256]))
+
+    links = []
+    for document_id, in db.session.query(Document.id).order_by(Document.id):
+        for tag_id in set(rng.choices(tag_ids, weights, k=rng.randint(1, 5))):
+            links.append({'document_id': document_id, 'tag_id': tag_id})
+    for batch in _batches(links):
+        db.session.execute(insert(document_tags), batch)
+    recount_tags()
+
+    if not User.query.filter_by(username=BENCH_USERNAME).first():
+        user = User(username=BENCH_USERNAME)
+        user.set_password(password)
+        db.session.add(user)
+    db.session.commit()
+    rebuild_search_index()
+    return {'articles': articles_count, 'documents': documents_count,
+            'tags': tags_count, 'document_tags': len(links), 'files': len(pool)}
+
+
+def _percentile(sorted_values, fraction):
+    """Percentile par rang le plus proche, en millisecondes"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return round(sorted_values[index] * 1000, 2)
+
+
+def _summary(durations):
+    durations = sorted(durations)
+    return {
+        'p50': _percentile(durations, 0.50),
+        'p95': _percentile(durations, 0.95),
+        'p99': _percentile(durations, 0.99),
+        'mean': round(sum(durations) / len(durations) * 1000, 2) if durations else None,
+        'max': round(durations[-1] * 1000, 2) if durations else None,
+    }
+
+
+class _AppClient:
+    """Requêtes directes sur l'application (client de test, sans réseau)"""
+
+    def __init__(self, app):
+        self._client = app.test_client(use_cookies=False)
+
+    def request(self, method, path, form=None):
+        response = self._client.open(path, method=method, data=form)
+        size = sum(len(chunk) for chunk in response.response)
+        response.close()
+        return response.status_code, size
+
+    def close(self):
+        pass
+
+
+class _HttpClient:
+    """Requêtes HTTP sur un serveur lancé à part, connexion persistante"""
+
+    def __init__(self, url, timeout=60):
+        parsed = urlparse(url)
+        connection_class = http.client.HTTPSConnection if parsed.scheme == 'https' else http.client.HTTPConnection
+        self._connection = connection_class(parsed.netloc, timeout=timeout)
+        self._prefix = parsed.path.rstrip('/')
+
+    def request(self, method, path, form=None):
+        body = urlencode(form) if form else None
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'} if form else {}
+        try:
+            self._connection.request(method, self._prefix + path, body=body, headers=headers)
+            response = self._connection.getresponse()
+            size = 0
+            while chunk := response.read(64 * 1024):
+                size += len(chunk)
+            return response.status, size
+        except (OSError, http.client.HTTPException):
+            self._connection.close()
+            raise
+
+    def close(self):
+        self._connection.close()
+
+
+def _targets(sample_size=1000):
+    """Identifiants réels tirés de la base pour construire les URL"""
+    return {
+        'articles': [row[0] for row in db.session.query(Article.id).order_by(func.random()).limit(sample_size)],
+        'documents': [row[0] for row in db.session.query(Document.id).order_by(func.random()).limit(sample_size)],
+        'tags': [row[0] for row in db.session.query(Tag.name)
+                 .filter(Tag.document_count > 0).order_by(Tag.document_count.desc()).limit(50)],
+    }
+
+
+def _next_request(rng, targets, password):
+    scenario = rng.choices(list(SCENARIOS), list(SCENARIOS.values()))[0]
+    if scenario == 'article' and targets['articles']:
+        return scenario, 'GET', f"/article/{rng.choice(targets['articles'])}", None
+    if scenario == 'documents_tag' and targets['tags']:
+        return scenario, 'GET', f"/documents?tag={quote(rng.choice(targets['tags']))}", None
+    if scenario == 'download' and targets['documents']:
+        return scenario, 'GET', f"/download/{rng.choice(targets['documents'])}", None
+    if scenario == 'login':
+        return scenario, 'POST', '/login', {'username': BENCH_USERNAME, 'password': password}
+    return 'home', 'GET', '/', None
+
+
+def run_load(app, url=None, duration=30.0, requests=None, concurrency=4, warmup=20,
+             seed=42, password='bench'):
+    """Lance la charge et retourne les résultats (débit, latences par scénario)"""
+    targets = _targets()
+    results = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    remaining = [requests] if requests else None
+    deadline = [None]
+
+    def make_client():
+        return _HttpClient(url) if url else _AppClient(app)
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        client = make_client()
+        local = defaultdict(list)
+        local_errors = defaultdict(int)
+        try:
+            while True:
+                if remaining is not None:
+                    with lock:
+                        if remaining[0] <= 0:
+                            break
+                        remaining[0] -= 1
+                elif time.perf_counter() >= deadline[0]:
+                    break
+                scenario, method, path, form = _next_request(rng, targets, password)
+                start = time.perf_counter()
+                try:
+                    status, _ = client.request(method, path, form)
+                    ok = status < 400
+                except (OSError, http.client.HTTPException):
+                    ok = False
+                local[scenario].append(time.perf_counter() - start)
+                if not ok:
+                    local_errors[scenario] += 1
+        finally:
+            client.close()
+            with lock:
+                for scenario, durations in local.items():
+                    results[scenario].extend(durations)
+                for scenario, count in local_errors.items():
+                    errors[scenario] += count
+
+    # Échauffement : caches, connexions et pages compilées
+    warm_rng = random.Random(seed)
+    client = make_client()
+    for _ in range(warmup):
+        _, method, path, form = _next_request(warm_rng, targets, password)
+        try:
+            client.request(method, path, form)
+        except (OSError, http.client.HTTPException):
+            pass
+    client.close()
+
+    started = time.perf_counter()
+    deadline[0] = started + duration
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    all_durations = [value for durations in results.values() for value in durations]
+    total = len(all_durations)
+    return {
+        'commit': _git_commit(),
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'target': url or 'in-process',
+        'concurrency': concurrency,
+        'seed': seed,
+        'corpus': {
+            'articles': db.session.query(func.count(Article.id)).scalar(),
+            'documents': db.session.query(func.count(Document.id)).scalar(),
+            'tags': db.session.query(func.count(Tag.id)).scalar(),
+        },
+        'duration_s': round(elapsed, 3),
+        'requests': total,
+        'errors': sum(errors.values()),
+        'throughput_rps': round(total / elapsed, 2) if elapsed else None,
+        'latency_ms': _summary(all_durations),
+        'scenarios': {
+            scenario: {'requests': len(durations), 'errors': errors[scenario], **_summary(durations)}
+            for scenario, durations in sorted(results.items())
+        },
+    }
+
+
+def _stress_config(uri, profile):
+    return {'SQLALCHEMY_DATABASE_URI': uri, 'SQLITE_PROFILE': profile, 'JINJA_CACHE_DIR': '',
+            'PAGE_CACHE_ENABLED': False}
+
+
+def _stress_worker(role, index, uri, profile, duration, barrier):
+    """Boucle d'un processus : écritures (INSERT/UPDATE d'articles) ou lectures de listes"""
+    # Import tardif : le processus est lancé par spawn, app importe ce module
+    from app import create_app
+
+    app = create_app(_stress_config(uri, profile))
+    rng = random.Random(index)
+    operations = 0
+    errors = Counter()
+    with app.app_context():
+        # Tous les processus démarrent ensemble, une fois l'application créée
+        barrier.wait()
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            try:
+                if role == 'writer':
+                    content = _paragraphs(rng, 2)
+                    db.session.add(Article(title=f"Stress {index}-{operations}", content=content,
+                                           **rendered_fields(content)))
+                    if operations % 5 == 0:
+                        db.session.execute(update(Article).where(Article.id == rng.randint(1, 200))
+                                           .values(title=_sentence(rng, 5)))
+                    db.session.commit()
+                else:
+                    db.session.query(Article).options(
+                        load_only(Article.id, Article.title, Article.excerpt, Article.created_date)
+                    ).order_by(Article.created_date.desc(), Article.id.desc()).limit(10).all()
+                    db.session.query(func.count(Article.id)).scalar()
+                    db.session.rollback()
+                operations += 1
+            except OperationalError as e:
+                db.session.rollback()
+                errors[str(e.orig)] += 1
+    return role, operations, errors
+
+
+def run_stress(path=None, duration=10.0, writers=4, readers=8, profile=True):
+    """Écritures et lectures simultanées sur une base SQLite, depuis writers + readers processus"""
+    from app import create_app
+
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(prefix='climate-blog-stress-'), 'stress.db')
+    uri = f"sqlite:///{os.path.abspath(path)}"
+    app = create_app(_stress_config(uri, profile))
+    with app.app_context():
+        db.create_all()
+        rng = random.Random(0)
+        content = _paragraphs(rng, 2)
+        db.session.execute(insert(Article), [
+            {'title': _sentence(rng, 5), 'content': content, 'created_date': BASE_DATE, **rendered_fields(content)}
+            for _ in range(200)
+        ])
+        db.session.commit()
+        db.engine.dispose()
+
+    roles = ['writer'] * writers + ['reader'] * readers
+    operations = Counter()
+    errors = Counter()
+    context = multiprocessing.get_context('spawn')
+    with context.Manager() as manager, \
+            ProcessPoolExecutor(max_workers=len(roles), mp_context=context) as pool:
+        barrier = manager.Barrier(len(roles))
+        futures = [pool.submit(_stress_worker, role, index, uri, profile, duration, barrier)
+                   for index, role in enumerate(roles)]
+        for future in futures:
+            role, count, worker_errors = future.result()
+            operations[role] += count
+            errors.update(worker_errors)
+    return {
+        'database': path,
+        'profile': profile,
+        'duration_s': duration,
+        'writers': writers,
+        'readers': readers,
+        'writes': operations['writer'],
+        'reads': operations['reader'],
+        'errors': sum(errors.values()),
+        'lock_errors': sum(count for message, count in errors.items() if 'locked' in message or 'busy' in message),
+        'messages': dict(errors.most_common(5)),
+    }
+
+
+def _slow_client(url, stop, interval):
+    """Envoie un formulaire de connexion un octet à la fois jusqu'à l'arrêt, puis recommence"""
+    parsed = urlparse(url)
+    head = (f"POST {parsed.path.rstrip('/')}/login HTTP/1.1\r\nHost: {parsed.netloc}\r\n"
+            f"Content-Type: application/x-www-form-urlencoded\r\nContent-Length: {SLOW_BODY_SIZE}\r\n\r\n")
+    while not stop.is_set():
+        try:
+            with socket.create_connection((parsed.hostname, parsed.port or 80), timeout=30) as sock:
+                sock.sendall(head.encode())
+                for _ in range(SLOW_BODY_SIZE):
+                    if stop.wait(interval):
+                        break
+                    sock.sendall(b'a')
+        except OSError:
+            stop.wait(interval)
+
+
+def run_slow_clients(url, slow=8, concurrency=4, duration=10.0, interval=0.1):
+    """Débit et latences de clients normaux pendant que slow clients lents occupent le serveur"""
+    stop = threading.Event()
+    slow_threads = [threading.Thread(target=_slow_client, args=(url, stop, interval), daemon=True)
+                    for _ in range(slow)]
+    for thread in slow_threads:
+        thread.start()
+    # Les clients lents ont le temps d'occuper workers ou threads avant la mesure
+    time.sleep(1)
+
+    durations = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        client = _HttpClient(url, timeout=duration)
+        local, local_errors = [], 0
+        try:
+            while time.perf_counter() < deadline:
+                path = SLOW_CLIENT_PATHS[(index + len(local) + local_errors) % len(SLOW_CLIENT_PATHS)]
+                start = time.perf_counter()
+                try:
+                    status, _ = client.request('GET', path)
+                    ok = status < 400
+                except (OSError, http.client.HTTPException):
+                    ok = False
+                if ok:
+                    local.append(time.perf_counter() - start)
+                else:
+                    local_errors += 1
+        finally:
+            client.close()
+            with lock:
+                durations.extend(local)
+                errors[0] += local_errors
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in slow_threads:
+        thread.join()
+    return {
+        'target': url,
+        'slow_clients': slow,
+        'concurrency': concurrency,
+        'duration_s': round(elapsed, 3),
+        'requests': len(durations),
+        'errors': errors[0],
+        'throughput_rps': round(len(durations) / elapsed, 2) if elapsed else None,
+        'latency_ms': _summary(durations),
+    }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn s'est arrêté au démarrage (code {process.returncode})")
+        client = _HttpClient(url, timeout=2)
+        try:
+            client.request('GET', '/')
+            return
+        except (OSError, http.client.HTTPException):
+            time.sleep(0.2)
+        finally:
+            client.close()
+    raise RuntimeError(f"gunicorn ne répond pas sur {url} après {timeout} s")
+
+
+def compare_workers(modes=('sync', 'gthread'), workers=2, threads=8, **options):
+    """Lance gunicorn dans chaque mode (même nombre de workers) et y mesure run_slow_clients"""
+    results = {}
+    for mode in modes:
+        port = _free_port()
+        url = f'http://127.0.0.1:{port}'
+        env = dict(os.environ, GUNICORN_WORKER_CLASS=mode, GUNICORN_WORKERS=str(workers),
+                   GUNICORN_THREADS=str(threads), PORT=str(port))
+        # Réglages du pool recalculés par gunicorn.conf.py pour chaque mode
+        env.pop('DB_POOL_SIZE', None)
+        process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                                   cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            _wait_ready(url, process)
+            results[mode] = {'workers': workers, 'threads': 1 if mode == 'sync' else threads,
+                             **run_slow_clients(url, **options)}
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+    return {
+        'commit': _git_commit(),
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'cpus': os.cpu_count(),
+        'modes': results,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,257 @@
+"""Cache des pages publiques rendues pour les visiteurs anonymes, et des utilisateurs connectés.
+
+Chaque entrée est indexée par la route, ses paramètres et une version de
+contenu. La version est un fichier partagé par tous les workers : les routes
+d'écriture le remplacent via invalidate(), ce qui rend obsolètes toutes les
+entrées en mémoire et sur disque d'un seul coup.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import current_app, make_response, request, session, stream_with_context
+from flask_login import current_user
+
+logger = logging.getLogger(__name__)
+
+
+class _Memory:
+    """Entrées en mémoire d'une application (LRU), partagées par ses threads"""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry, max_entries):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class PageCache:
+    """Cache LRU en mémoire, avec un second niveau optionnel sur disque.
+
+    Les entrées appartiennent à l'application (app.extensions), pas à l'extension.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PAGE_CACHE_ENABLED', os.environ.get('PAGE_CACHE_ENABLED', '1') == '1')
+        app.config.setdefault('PAGE_CACHE_MAX_ENTRIES', int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', '256')))
+        # Dossier partagé entre workers pour le second niveau (désactivé si vide)
+        app.config.setdefault('PAGE_CACHE_DIR', os.environ.get('PAGE_CACHE_DIR', ''))
+        app.extensions['page_cache'] = self
+        app.extensions['page_cache_memory'] = _Memory()
+
+    @staticmethod
+    def _memory():
+        return current_app.extensions['page_cache_memory']
+
+    def _version_path(self):
+        folder = current_app.config['PAGE_CACHE_DIR'] or current_app.instance_path
+        return os.path.join(folder, 'page_cache.version')
+
+    def version(self):
+        """Retourne (jeton de version, date de dernière modification du contenu)"""
+        path = self._version_path()
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.invalidate()
+            stat = os.stat(path)
+        last_modified = datetime.fromtimestamp(int(stat.st_mtime), tz=timezone.utc)
+        # Chaque invalidation crée un nouveau fichier : inode et date changent
+        return f"{stat.st_ino:x}-{stat.st_mtime_ns:x}", last_modified
+
+    def invalidate(self):
+        """Rend obsolètes toutes les pages en cache, dans tous les workers"""
+        path = self._version_path()
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, 'w') as f:
+            f.write(os.urandom(8).hex())
+        os.replace(tmp_path, path)
+        self._memory().clear()
+        if current_app.config['PAGE_CACHE_DIR']:
+            for name in os.listdir(folder):
+                if name.endswith('.page'):
+                    try:
+                        os.remove(os.path.join(folder, name))
+                    except OSError:
+                        pass
+
+    def _disk_path(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(current_app.config['PAGE_CACHE_DIR'], f"{digest}.page")
+
+    def get(self, key):
+        entry = self._memory().get(key)
+        if entry is not None:
+            return entry
+        if not current_app.config['PAGE_CACHE_DIR']:
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                meta = json.loads(f.readline())
+                entry = (f.read(), meta['mimetype'], meta['etag'])
+        except (OSError, ValueError, KeyError):
+            return None
+        self._remember(key, entry)
+        return entry
+
+    def set(self, key, entry):
+        self._remember(key, entry)
+        if not current_app.config['PAGE_CACHE_DIR']:
+            return
+        body, mimetype, etag = entry
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(json.dumps({'mimetype': mimetype, 'etag': etag}).encode('utf-8') + b'\n')
+                f.write(body)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Écriture du cache disque impossible : {str(e)}")
+
+    def _remember(self, key, entry):
+        self._memory().put(key, entry, current_app.config['PAGE_CACHE_MAX_ENTRIES'])
+
+    def _store_when_complete(self, key, encoded, mimetype):
+        chunks = []
+        for chunk in encoded:
+            chunks.append(chunk)
+            yield chunk
+        if not session.modified:
+            body = b''.join(chunks)
+            self.set(key, (body, mimetype, hashlib.sha1(body).hexdigest()))
+
+    @staticmethod
+    def _cacheable():
+        """Seules les pages vues par un visiteur anonyme sans message flash sont partagées"""
+        return (current_app.config['PAGE_CACHE_ENABLED']
+                and request.method in ('GET', 'HEAD')
+                and not current_user.is_authenticated
+                and '_flashes' not in session)
+
+    def cached(self, view):
+        """Décorateur : sert la page depuis le cache avec ETag, Last-Modified et 304"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self._cacheable():
+                return view(*args, **kwargs)
+
+            version, last_modified = self.version()
+            # Paramètres réencodés : une valeur contenant & ou = ne peut pas imiter un autre filtre
+            query = urlencode(sorted(request.args.items(multi=True)))
+            key = f"{version}:{request.path}?{query}"
+
+            entry = self.get(key)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                # Pas de mise en cache si la vue a modifié la session (flash, connexion...)
+                if response.status_code != 200 or session.modified:
+                    return response
+                if response.is_streamed:
+                    # Page envoyée pendant son rendu : mise en cache une fois terminée
+                    response.response = stream_with_context(
+                        self._store_when_complete(key, response.iter_encoded(), response.mimetype))
+                    response.headers['Cache-Control'] = 'no-cache'
+                    return response
+                body = response.get_data()
+                entry = (body, response.mimetype, hashlib.sha1(body).hexdigest())
+                self.set(key, entry)
+
+            body, mimetype, etag = entry
+            response = current_app.response_class(body, mimetype=mimetype)
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            # Le navigateur garde la page mais doit la revalider à chaque visite
+            response.headers['Cache-Control'] = 'no-cache'
+            return response.make_conditional(request)
+        return wrapper
+
+
+class UserCache:
+    """Utilisateurs connectés gardés en mémoire : plus de requête SQL par page d'administration.
+
+    Les entrées expirent après USER_CACHE_TTL secondes. Un changement de mot
+    de passe ou de nom d'utilisateur remplace un fichier de version partagé
+    par les workers, comme pour le cache des pages : toutes les entrées sont
+    alors relues depuis la base.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('USER_CACHE_TTL', float(os.environ.get('USER_CACHE_TTL', '300')))
+        app.config.setdefault('USER_CACHE_MAX_ENTRIES', int(os.environ.get('USER_CACHE_MAX_ENTRIES', '128')))
+        app.extensions['user_cache'] = self
+        app.extensions['user_cache_memory'] = _Memory()
+
+    @staticmethod
+    def _memory():
+        return current_app.extensions['user_cache_memory']
+
+    def _version_path(self):
+        folder = current_app.config['PAGE_CACHE_DIR'] or current_app.instance_path
+        return os.path.join(folder, 'user_cache.version')
+
+    def _version(self):
+        try:
+            stat = os.stat(self._version_path())
+        except FileNotFoundError:
+            return None
+        return f"{stat.st_ino:x}-{stat.st_mtime_ns:x}"
+
+    def get(self, user_id, loader):
+        """Retourne l'utilisateur en cache, ou celui renvoyé par loader(user_id)"""
+        ttl = current_app.config['USER_CACHE_TTL']
+        if ttl <= 0:
+            return loader(user_id)
+        version = self._version()
+        now = time.monotonic()
+        memory = self._memory()
+        entry = memory.get(user_id)
+        if entry is not None and entry[0] == version and entry[1] > now:
+            return entry[2]
+        user = loader(user_id)
+        if user is not None:
+            memory.put(user_id, (version, now + ttl, user), current_app.config['USER_CACHE_MAX_ENTRIES'])
+        return user
+
+    def invalidate(self):
+        """Oublie les utilisateurs en cache, dans tous les workers"""
+        path = self._version_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, 'w') as f:
+            f.write(os.urandom(8).hex())
+        os.replace(tmp_path, path)
+        self._memory().clear()
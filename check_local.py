@@ -1,6 +1,8 @@
-from app import app
+from app import create_app
 from models import db, User, Article, Document, Tag
 
+app = create_app()
+
 print("\n=== Vérification de l'environnement local ===")
 
 with app.app_context():
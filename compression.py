@@ -0,0 +1,152 @@
+"""Compression des réponses dynamiques et envoi des grandes pages par morceaux.
+
+Les réponses textuelles (HTML, JSON, XML, CSS, JS) sont compressées en
+brotli ou gzip selon l'en-tête Accept-Encoding, au-delà de
+COMPRESS_MIN_SIZE octets. Les pages servies depuis un cache (ETag fixe) ne
+sont compressées qu'une fois : le résultat est gardé en mémoire par ETag et
+encodage.
+
+stream_page() rend un template au fil de l'eau : les premiers octets partent
+pendant que la suite du tableau est encore en cours de rendu. Une page
+envoyée ainsi est compressée morceau par morceau.
+"""
+import gzip
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+from flask import current_app, get_flashed_messages, request, stream_template, stream_with_context
+
+try:
+    import brotli
+except ImportError:  # Seul gzip est alors proposé
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/xml', 'text/javascript',
+    'application/json', 'application/javascript', 'application/xml', 'application/atom+xml',
+}
+# Taille des morceaux envoyés par stream_page (le rendu Jinja produit des fragments minuscules)
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def _buffered(chunks, size):
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_page(template_name, **context):
+    """Réponse HTML envoyée par morceaux pendant le rendu du template"""
+    # Messages flash retirés de la session avant l'envoi des en-têtes (cookie de session) :
+    # lus pendant le rendu, ils resteraient dans la session et réapparaîtraient
+    context.setdefault('flashed_messages', get_flashed_messages(with_categories=True))
+    chunks = _buffered(stream_template(template_name, **context), STREAM_CHUNK_SIZE)
+    return current_app.response_class(stream_with_context(chunks), mimetype='text/html')
+
+
+class Compression:
+    """Compression négociée (br, gzip) des réponses textuelles"""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """À appeler après les extensions qui mesurent la réponse (metrics) : elles voient la taille compressée"""
+        app.config.setdefault('COMPRESS_ENABLED', os.environ.get('COMPRESS_ENABLED', '1') == '1')
+        app.config.setdefault('COMPRESS_MIN_SIZE', int(os.environ.get('COMPRESS_MIN_SIZE', '500')))
+        app.config.setdefault('COMPRESS_GZIP_LEVEL', int(os.environ.get('COMPRESS_GZIP_LEVEL', '6')))
+        # Qualité modérée : compression à chaque requête, pas au build comme pour static/
+        app.config.setdefault('COMPRESS_BR_QUALITY', int(os.environ.get('COMPRESS_BR_QUALITY', '5')))
+        app.config.setdefault('COMPRESS_CACHE_ENTRIES', int(os.environ.get('COMPRESS_CACHE_ENTRIES', '128')))
+        app.extensions['compression'] = self
+        # Corps compressés des réponses à ETag fort, propres à l'application : (etag, encodage) -> octets
+        app.extensions['compression_cache'] = OrderedDict()
+        app.after_request(self._compress)
+
+    @staticmethod
+    def _encoding():
+        accepted = request.accept_encodings
+        for encoding in ('br', 'gzip'):
+            if encoding == 'br' and brotli is None:
+                continue
+            if accepted[encoding] > 0:
+                return encoding
+        return None
+
+    def _compress(self, response):
+        config = current_app.config
+        if (not config['COMPRESS_ENABLED'] or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or response.direct_passthrough or 'Content-Encoding' in response.headers
+                or response.status_code in (204, 206)):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self._encoding()
+        if encoding is None:
+            return response
+
+        etag, weak = response.get_etag()
+        if response.status_code == 304:
+            if etag and not weak:
+                response.set_etag(etag, weak=True)
+            return response
+
+        if response.is_streamed:
+            response.response = self._compress_stream(response.iter_encoded(), encoding, config)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < config['COMPRESS_MIN_SIZE']:
+                return response
+            response.set_data(self._compress_cached(data, encoding, etag if etag and not weak else None, config))
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            # Même ressource, autre représentation : l'ETag devient faible (If-None-Match compare en faible)
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _compress_cached(self, data, encoding, etag, config):
+        if etag is None:
+            return _compress_data(data, encoding, config)
+        key = (etag, encoding)
+        cache = current_app.extensions['compression_cache']
+        with self._lock:
+            compressed = cache.get(key)
+            if compressed is not None:
+                cache.move_to_end(key)
+                return compressed
+        compressed = _compress_data(data, encoding, config)
+        with self._lock:
+            cache[key] = compressed
+            while len(cache) > config['COMPRESS_CACHE_ENTRIES']:
+                cache.popitem(last=False)
+        return compressed
+
+    @staticmethod
+    def _compress_stream(chunks, encoding, config):
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=config['COMPRESS_BR_QUALITY'])
+            for chunk in chunks:
+                yield compressor.process(chunk) + compressor.flush()
+            yield compressor.finish()
+        else:
+            compressor = zlib.compressobj(config['COMPRESS_GZIP_LEVEL'], zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            for chunk in chunks:
+                # Vidage à chaque morceau : le navigateur affiche le début de la page sans attendre la fin
+                yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield compressor.flush()
+
+
+def _compress_data(data, encoding, config):
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BR_QUALITY'])
+    return gzip.compress(data, compresslevel=config['COMPRESS_GZIP_LEVEL'], mtime=0)
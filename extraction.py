@@ -0,0 +1,248 @@
+"""Extraction du texte brut des documents uploadés.
+
+L'extraction tourne dans un pool de processus : la requête d'upload ne fait
+que soumettre le travail, le résultat est enregistré dans DocumentText par
+un callback puis le document est réindexé pour la recherche.
+"""
+import atexit
+import datetime
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from flask import current_app
+
+from models import db, Document, DocumentText
+
+logger = logging.getLogger(__name__)
+
+# Formats binaires anciens (doc, xls, ppt) non pris en charge
+SUPPORTED_EXTENSIONS = {'pdf', 'docx', 'xlsx', 'pptx', 'txt'}
+
+
+class ExtractionTimeout(Exception):
+    pass
+
+
+def _extract_pdf(path):
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    for page in reader.pages:
+        yield page.extract_text() or ''
+
+
+def _extract_docx(path):
+    import docx
+    for paragraph in docx.Document(path).paragraphs:
+        yield paragraph.text
+
+
+def _extract_xlsx(path):
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            for row in sheet.iter_rows(values_only=True):
+                yield ' '.join(str(value) for value in row if value is not None)
+    finally:
+        workbook.close()
+
+
+def _extract_pptx(path):
+    from pptx import Presentation
+    for slide in Presentation(path).slides:
+        for shape in slide.shapes:
+            if shape.has_text_frame:
+                yield shape.text_frame.text
+
+
+def _extract_txt(path):
+    with open(path, 'rb') as f:
+        raw = f.read()
+    try:
+        yield raw.decode('utf-8')
+    except UnicodeDecodeError:
+        yield raw.decode('latin-1')
+
+
+EXTRACTORS = {
+    'pdf': _extract_pdf,
+    'docx': _extract_docx,
+    'xlsx': _extract_xlsx,
+    'pptx': _extract_pptx,
+    'txt': _extract_txt,
+}
+
+
+def extract_text(path, extension, max_chars):
+    """Extrait le texte d'un fichier, tronqué à max_chars caractères"""
+    if extension not in EXTRACTORS:
+        raise ValueError(f"Format non pris en charge : {extension}")
+    parts = []
+    size = 0
+    for part in EXTRACTORS[extension](path):
+        parts.append(part)
+        size += len(part) + 1
+        if size >= max_chars:
+            break
+    return '\n'.join(parts)[:max_chars]
+
+
+def _on_timeout(signum, frame):
+    raise ExtractionTimeout()
+
+
+def extract_job(document_id, path, extension, timeout, max_chars):
+    """Tâche exécutée dans un processus du pool. Retourne (id, texte, erreur)."""
+    signal.signal(signal.SIGALRM, _on_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return document_id, extract_text(path, extension, max_chars), None
+    except ExtractionTimeout:
+        return document_id, None, f"Délai d'extraction dépassé ({timeout} s)"
+    except Exception as e:
+        return document_id, None, f"{type(e).__name__}: {e}"[:500]
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def document_path(app, document):
+    """Fichier local du document (depuis le cache pour un backend distant)"""
+    try:
+        return app.extensions['storage'].local_path(document.filename)
+    except FileNotFoundError:
+        # L'extraction échouera avec un message explicite
+        return os.path.join(app.config['UPLOAD_FOLDER'], document.filename)
+
+
+def file_extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+
+def is_supported(filename):
+    return file_extension(filename) in SUPPORTED_EXTENSIONS
+
+
+def pending_text(filename):
+    """Ligne DocumentText initiale d'un nouveau document"""
+    if is_supported(filename):
+        return DocumentText(status='pending')
+    return DocumentText(status='failed', error='Format non pris en charge')
+
+
+def store_result(document_id, content, error):
+    """Enregistre le résultat d'une extraction et réindexe le document"""
+    from search import index_document
+
+    record = db.session.get(DocumentText, document_id)
+    document = db.session.get(Document, document_id)
+    if document is None:
+        # Document supprimé pendant l'extraction
+        return
+    if record is None:
+        record = DocumentText(document_id=document_id)
+        db.session.add(record)
+    record.status = 'failed' if error else 'done'
+    record.content = content
+    record.error = error
+    record.extracted_date = datetime.datetime.utcnow()
+    db.session.flush()
+    index_document(document)
+
+
+class TextExtractor:
+    """Pool de processus d'extraction partagé par les requêtes d'un worker"""
+
+    def __init__(self, app=None):
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('EXTRACTION_WORKERS', int(os.environ.get('EXTRACTION_WORKERS', '1')))
+        app.config.setdefault('EXTRACTION_TIMEOUT', int(os.environ.get('EXTRACTION_TIMEOUT', '60')))
+        app.config.setdefault('EXTRACTION_MAX_CHARS', int(os.environ.get('EXTRACTION_MAX_CHARS', '1000000')))
+        app.extensions['text_extractor'] = self
+        atexit.register(self.shutdown)
+
+    def _get_pool(self, workers):
+        with self._lock:
+            # Un pool hérité d'un fork (gunicorn) n'est pas utilisable
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def submit(self, document):
+        """Planifie l'extraction d'un document, à appeler après son commit.
+
+        Avec EXTRACTION_WORKERS = 0, le document reste en attente et sera
+        traité par la commande flask extract-text.
+        """
+        app = current_app._get_current_object()
+        workers = app.config['EXTRACTION_WORKERS']
+        if workers <= 0 or not is_supported(document.original_filename):
+            return None
+        future = self._get_pool(workers).submit(
+            extract_job, document.id, document_path(app, document),
+            file_extension(document.original_filename),
+            app.config['EXTRACTION_TIMEOUT'], app.config['EXTRACTION_MAX_CHARS']
+        )
+        future.add_done_callback(partial(self._store_future, app, document.id))
+        return future
+
+    def _store_future(self, app, document_id, future):
+        """Callback exécuté dans le worker web quand l'extraction se termine"""
+        try:
+            document_id, content, error = future.result()
+        except Exception as e:
+            content, error = None, f"{type(e).__name__}: {e}"[:500]
+        with app.app_context():
+            try:
+                store_result(document_id, content, error)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Erreur lors de l'enregistrement du texte extrait {document_id} : {str(e)}")
+
+    def run_batch(self, app, documents, workers):
+        """Extrait un lot de documents en parallèle et attend les résultats"""
+        pool = self._get_pool(workers)
+        timeout = app.config['EXTRACTION_TIMEOUT']
+        futures = {}
+        results = []
+        for document in documents:
+            if not is_supported(document.original_filename):
+                results.append((document.id, None, 'Format non pris en charge'))
+                continue
+            futures[document.id] = pool.submit(
+                extract_job, document.id, document_path(app, document),
+                file_extension(document.original_filename),
+                timeout, app.config['EXTRACTION_MAX_CHARS']
+            )
+        for document_id, future in futures.items():
+            try:
+                # Marge au-delà du délai appliqué dans le processus fils
+                results.append(future.result(timeout=timeout + 30))
+            except FutureTimeoutError:
+                results.append((document_id, None, f"Délai d'extraction dépassé ({timeout} s)"))
+            except Exception as e:
+                results.append((document_id, None, f"{type(e).__name__}: {e}"[:500]))
+        for document_id, content, error in results:
+            store_result(document_id, content, error)
+        return results
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
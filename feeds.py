@@ -0,0 +1,174 @@
+"""Flux Atom et plan du site, générés une fois par version du contenu.
+
+Les fichiers sont gardés en mémoire sous forme d'octets, avec leur ETag et
+leur date de dernière modification. Ils ne sont régénérés qu'après une
+écriture : la version est celle du cache des pages, que les routes
+d'écriture remplacent via page_cache.invalidate(). Les agrégateurs et robots
+qui interrogent régulièrement le site reçoivent donc surtout des 304.
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape, quoteattr
+
+from flask import current_app, request, url_for
+from sqlalchemy.orm import load_only
+
+from models import db, Article, Document
+
+ATOM_NS = 'http://www.w3.org/2005/Atom'
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+FEED_TITLE = "Les Cahiers de l'Adaptation"
+# Limite du protocole sitemap par fichier
+SITEMAP_MAX_URLS = 50000
+# Flux et plans du site gardés en mémoire (un par nom et par adresse)
+MAX_BUFFERS = 8
+
+
+def _iso(date):
+    """Date UTC au format RFC 3339 (les dates sont stockées en UTC, sans fuseau)"""
+    return date.replace(tzinfo=timezone.utc, microsecond=0).isoformat()
+
+
+def _external(base_url, endpoint, **values):
+    """URL absolue sur l'adresse du site (SITE_URL) plutôt que sur l'hôte de la requête"""
+    return base_url + url_for(endpoint, **values)
+
+
+def build_feed(base_url, limit):
+    """Atom des derniers articles et documents. Retourne (octets, date de mise à jour)."""
+    articles = (Article.query
+                .options(load_only(Article.id, Article.title, Article.excerpt,
+                                   Article.content_html, Article.created_date))
+                .order_by(Article.created_date.desc(), Article.id.desc())
+                .limit(limit).all())
+    documents = (Document.query
+                 .options(load_only(Document.id, Document.title, Document.author,
+                                    Document.description, Document.upload_date))
+                 .order_by(Document.upload_date.desc(), Document.id.desc())
+                 .limit(limit).all())
+    entries = [(article.created_date, 'article', article) for article in articles]
+    entries += [(document.upload_date, 'document', document) for document in documents]
+    entries = sorted(entries, key=lambda entry: entry[0] or datetime.min, reverse=True)[:limit]
+    updated = entries[0][0] if entries and entries[0][0] else datetime(2000, 1, 1)
+
+    out = io.StringIO()
+    out.write(f'<?xml version="1.0" encoding="utf-8"?>\n<feed xmlns="{ATOM_NS}">\n')
+    out.write(f'<title>{escape(FEED_TITLE)}</title>\n')
+    out.write(f'<id>{escape(_external(base_url, "main.home"))}</id>\n')
+    out.write(f'<link rel="alternate" href={quoteattr(_external(base_url, "main.home"))}/>\n')
+    out.write(f'<link rel="self" href={quoteattr(_external(base_url, "main.feed"))}/>\n')
+    out.write(f'<updated>{_iso(updated)}</updated>\n')
+    for date, kind, item in entries:
+        date = date or updated
+        if kind == 'article':
+            link = _external(base_url, 'main.article', article_id=item.id)
+            summary = item.excerpt or ''
+            content = item.content_html
+        else:
+            link = _external(base_url, 'main.download_document', document_id=item.id)
+            summary = ' — '.join(part for part in (item.author, item.description) if part)
+            content = None
+        out.write('<entry>\n')
+        out.write(f'<id>{escape(link)}</id>\n')
+        out.write(f'<title>{escape(item.title)}</title>\n')
+        out.write(f'<link rel="alternate" href={quoteattr(link)}/>\n')
+        out.write(f'<updated>{_iso(date)}</updated>\n')
+        out.write(f'<published>{_iso(date)}</published>\n')
+        if summary:
+            out.write(f'<summary>{escape(summary)}</summary>\n')
+        if content:
+            out.write(f'<content type="html">{escape(content)}</content>\n')
+        out.write('</entry>\n')
+    out.write('</feed>\n')
+    return out.getvalue().encode('utf-8'), updated
+
+
+def build_sitemap(base_url, batch_size=1000):
+    """Plan du site : pages de liste, articles puis documents récents. Retourne (octets, date)."""
+    out = io.StringIO()
+    out.write(f'<?xml version="1.0" encoding="utf-8"?>\n<urlset xmlns="{SITEMAP_NS}">\n')
+    updated = None
+    count = 0
+
+    def add(location, date=None):
+        out.write(f'<url><loc>{escape(location)}</loc>')
+        if date:
+            out.write(f'<lastmod>{_iso(date)}</lastmod>')
+        out.write('</url>\n')
+
+    add(_external(base_url, 'main.home'))
+    add(_external(base_url, 'main.documents'))
+    count += 2
+    sources = (
+        (db.session.query(Article.id, Article.created_date).order_by(Article.created_date.desc(), Article.id.desc()),
+         lambda item_id: _external(base_url, 'main.article', article_id=item_id)),
+        (db.session.query(Document.id, Document.upload_date).order_by(Document.upload_date.desc(), Document.id.desc()),
+         lambda item_id: _external(base_url, 'main.download_document', document_id=item_id)),
+    )
+    for query, make_url in sources:
+        remaining = SITEMAP_MAX_URLS - count
+        if remaining <= 0:
+            break
+        for item_id, date in query.limit(remaining).yield_per(batch_size):
+            add(make_url(item_id), date)
+            count += 1
+            if date and (updated is None or date > updated):
+                updated = date
+    out.write('</urlset>\n')
+    return out.getvalue().encode('utf-8'), updated or datetime(2000, 1, 1)
+
+
+class Feeds:
+    """Octets du flux et du plan du site, par version du contenu et par adresse du site"""
+
+    builders = {
+        'feed': ('application/atom+xml', lambda base_url: build_feed(base_url, current_app.config['FEED_ENTRIES'])),
+        'sitemap': ('application/xml', build_sitemap),
+    }
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FEED_ENTRIES', int(os.environ.get('FEED_ENTRIES', '30')))
+        # Adresse publique du site (https://exemple.org) : liens absolus du flux et du plan du site
+        app.config.setdefault('SITE_URL', os.environ.get('SITE_URL', ''))
+        app.extensions['feeds'] = self
+        # Octets générés, propres à l'application : (nom, adresse) -> (version, corps, etag, date).
+        # Sans SITE_URL, l'adresse vient de l'en-tête Host : les entrées sont alors bornées
+        app.extensions['feeds_buffers'] = OrderedDict()
+
+    def _get(self, name):
+        version, _ = current_app.extensions['page_cache'].version()
+        base_url = (current_app.config['SITE_URL'] or request.host_url).rstrip('/')
+        key = (name, base_url)
+        buffers = current_app.extensions['feeds_buffers']
+        with self._lock:
+            entry = buffers.get(key)
+            if entry is not None:
+                buffers.move_to_end(key)
+        if entry is None or entry[0] != version:
+            body, updated = self.builders[name][1](base_url)
+            entry = (version, body, hashlib.sha1(body).hexdigest(), updated)
+            with self._lock:
+                buffers[key] = entry
+                buffers.move_to_end(key)
+                while len(buffers) > MAX_BUFFERS:
+                    buffers.popitem(last=False)
+        return entry
+
+    def response(self, name):
+        """Réponse conditionnelle (ETag, Last-Modified, 304)"""
+        _, body, etag, updated = self._get(name)
+        response = current_app.response_class(body, mimetype=self.builders[name][0])
+        response.set_etag(etag)
+        response.last_modified = updated.replace(tzinfo=timezone.utc)
+        # Revalidation à chaque interrogation, servie par un 304 tant que rien n'a changé
+        response.headers['Cache-Control'] = 'public, no-cache'
+        return response.make_conditional(request)
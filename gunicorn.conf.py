@@ -1,9 +1,31 @@
+import glob
 import os
 
 # Configuration des workers
-workers = int(os.environ.get('GUNICORN_WORKERS', '2'))  # Par défaut 2 workers
-worker_class = 'sync'  # Type de worker
-worker_connections = 1000  # Nombre maximum de connexions simultanées par worker
+# gthread : plusieurs threads par worker, un client lent (envoi ou lecture au
+# compte-gouttes) n'immobilise qu'un thread et non tout le processus.
+# sync : un worker par requête en cours, comme avant (GUNICORN_WORKER_CLASS=sync)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+_cpus = os.cpu_count() or 1
+if worker_class == 'sync':
+    workers = int(os.environ.get('GUNICORN_WORKERS') or 2 * _cpus + 1)
+    threads = 1
+else:
+    # Les threads partagent le GIL : un worker par cœur suffit, au moins 2 pour survivre au redémarrage de l'un
+    workers = int(os.environ.get('GUNICORN_WORKERS') or max(2, _cpus))
+    threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+# Connexions à la base : chaque thread peut en tenir une, plus une petite réserve
+# par worker. DB_MAX_CONNECTIONS (limite du serveur PostgreSQL ou du pgbouncer,
+# moins les autres clients) borne le total de tous les workers.
+_db_overflow = int(os.environ.setdefault('DB_MAX_OVERFLOW', '2'))
+_db_max = int(os.environ.get('DB_MAX_CONNECTIONS', '0'))
+if _db_max:
+    threads = max(1, min(threads, _db_max // workers - _db_overflow))
+# Lu par create_app dans le master (preload_app) comme dans les workers
+os.environ.setdefault('DB_POOL_SIZE', str(threads))
+worker_connections = 1000  # Connexions simultanées par worker (gthread : y compris celles en keep-alive)
+# Application chargée une fois dans le master : les workers démarrent déjà prêts
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
 
 # Configuration du serveur
 bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
@@ -19,3 +41,29 @@ loglevel = 'info'
 limit_request_line = 4096
 limit_request_fields = 100
 limit_request_field_size = 8190
+
+# Métriques Prometheus partagées entre workers (fichiers dans ce dossier)
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(os.environ.get('TMPDIR', '/tmp'), 'climate-blog-metrics'))
+
+
+def on_starting(server):
+    # Les fichiers d'un lancement précédent fausseraient les compteurs
+    folder = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    os.makedirs(folder, exist_ok=True)
+    for path in glob.glob(os.path.join(folder, '*.db')):
+        os.remove(path)
+
+
+def post_fork(server, worker):
+    # Aucune connexion ouverte dans le master ne doit être partagée avec un worker
+    if preload_app:
+        from app import db
+        from wsgi import app
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,263 @@
+"""Import en masse de documents : plusieurs fichiers, des archives ZIP ou un dossier.
+
+Les métadonnées (titre, auteur, année, description, tags) viennent d'un
+manifeste CSV ou JSON facultatif, fourni à part ou placé à la racine de
+l'archive ou du dossier (manifest.csv, manifest.json). Les fichiers sont lus
+en flux, hachés et écrits dans le stockage par un pool de threads ; les
+documents, leurs tags et leurs entrées d'index sont ensuite insérés par lots,
+une transaction par lot. Chaque fichier reçoit une ligne de rapport.
+
+Un contenu déjà présent dans la bibliothèque est ignoré par défaut : relancer
+un import interrompu n'ajoute que les fichiers manquants.
+"""
+import csv
+import io
+import json
+import logging
+import os
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from sqlalchemy import select
+
+from extraction import pending_text
+from models import db, Document
+from search import index_document
+from storage import discard_staged, discard_stored, read_chunks, stage_chunks, store_staged
+from tags import normalize_tag_names, resolve_tags
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAMES = ('manifest.csv', 'manifest.json')
+MANIFEST_FIELDS = ('title', 'author', 'year', 'description', 'tags')
+
+# Fichier à importer : nom (chemin relatif dans l'archive ou le dossier) et ouverture en binaire
+Item = namedtuple('Item', 'name open size')
+# Ligne du rapport : statut created, exists, rejected ou error
+Result = namedtuple('Result', 'name status document_id message')
+
+
+def _ignored(name):
+    parts = name.replace('\\', '/').split('/')
+    return any(part.startswith('.') or part == '__MACOSX' for part in parts)
+
+
+def item_from_file(path):
+    return Item(os.path.basename(path), lambda: open(path, 'rb'), os.path.getsize(path))
+
+
+def items_from_directory(folder):
+    items = []
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, folder).replace(os.sep, '/')
+            if not _ignored(relative):
+                items.append(Item(relative, lambda path=path: open(path, 'rb'), os.path.getsize(path)))
+    return items
+
+
+def items_from_zip(archive):
+    """Fichiers d'une archive (chemin ou flux positionnable), lus à la demande"""
+    zf = zipfile.ZipFile(archive)
+    return [Item(info.filename, lambda info=info: zf.open(info), info.file_size)
+            for info in zf.infolist() if not info.is_dir() and not _ignored(info.filename)]
+
+
+def items_from_uploads(files):
+    """Fichiers d'un formulaire (FileStorage) ; les archives .zip sont ouvertes"""
+    items = []
+    for file in files:
+        if not file or not file.filename:
+            continue
+        if file.filename.lower().endswith('.zip'):
+            items.extend(items_from_zip(file.stream))
+        else:
+            items.append(Item(file.filename, lambda file=file: _Unclosed(file.stream), None))
+    return items
+
+
+class _Unclosed:
+    """Flux d'un upload : werkzeug le ferme lui-même en fin de requête"""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def __enter__(self):
+        return self._stream
+
+    def __exit__(self, *exc):
+        return False
+
+
+def split_manifest(items):
+    """Sépare le manifeste éventuel (à la racine) des fichiers à importer"""
+    manifest = None
+    files = []
+    for item in items:
+        if manifest is None and item.name.lower() in MANIFEST_NAMES:
+            with item.open() as f:
+                manifest = read_manifest(f, item.name)
+        else:
+            files.append(item)
+    return manifest, files
+
+
+def read_manifest(stream, name):
+    """Manifeste CSV (une colonne filename) ou JSON (liste d'objets, ou objet par nom de fichier).
+
+    Retourne {nom de fichier: métadonnées}.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig')
+    if name.lower().endswith('.json'):
+        data = json.load(text)
+        if isinstance(data, dict):
+            rows = [dict(value, filename=key) for key, value in data.items()]
+        else:
+            rows = data
+    else:
+        rows = list(csv.DictReader(text))
+    manifest = {}
+    for row in rows:
+        row = {str(key).strip().lower(): value for key, value in row.items() if key}
+        filename = (row.get('filename') or row.get('file') or '').strip()
+        if filename:
+            manifest[filename.replace('\\', '/')] = {key: row.get(key) for key in MANIFEST_FIELDS}
+    return manifest
+
+
+def _metadata(manifest, name):
+    if not manifest:
+        return {}
+    return manifest.get(name) or manifest.get(os.path.basename(name)) or {}
+
+
+def _tag_names(value):
+    if isinstance(value, (list, tuple)):
+        return normalize_tag_names(value)
+    return normalize_tag_names(str(value or '').replace(';', ',').split(','))
+
+
+def _year(value):
+    value = str(value or '').strip()
+    return int(value) if value.isdigit() else None
+
+
+def _stage(app, item, max_size):
+    """Dans un thread du pool : lecture, hachage et écriture dans le dossier temporaire"""
+    if max_size and item.size is not None and item.size > max_size:
+        raise ValueError(f"Fichier trop volumineux ({item.size} octets)")
+    with app.app_context(), item.open() as f:
+        return stage_chunks(read_chunks(f))
+
+
+def ingest_documents(items, manifest=None, allowed=None, default_tags=(), workers=4, batch_size=100,
+                     skip_existing=True, max_size=None):
+    """Importe les fichiers. Retourne le rapport, une ligne par fichier (les refusés en tête)."""
+    results = []
+    accepted = []
+    for item in items:
+        name = os.path.basename(item.name)
+        if allowed is not None and not allowed(name):
+            results.append(Result(item.name, 'rejected', None, 'Type de fichier non autorisé'))
+        else:
+            accepted.append(item)
+
+    seen = set()
+    batch = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        app = current_app._get_current_object()
+        futures = [(item, pool.submit(_stage, app, item, max_size)) for item in accepted]
+        for item, future in futures:
+            try:
+                staged = future.result()
+            except Exception as e:
+                logger.warning("Import de %s impossible : %s", item.name, e)
+                results.append(Result(item.name, 'error', None, str(e)[:200]))
+                continue
+            batch.append((item, staged))
+            if len(batch) >= batch_size:
+                results.extend(_insert_batch(batch, manifest, default_tags, skip_existing, seen))
+                batch = []
+        if batch:
+            results.extend(_insert_batch(batch, manifest, default_tags, skip_existing, seen))
+    return results
+
+
+def _insert_batch(batch, manifest, default_tags, skip_existing, seen):
+    """Une transaction : références de stockage, documents, liens de tags et index"""
+    results = []
+    documents = []
+    placed = set()
+    # Contenus rangés par ce lot : (sha256, taille)
+    stored = []
+    try:
+        existing = set()
+        if skip_existing:
+            hashes = [sha256 for _, (_, sha256, _) in batch]
+            existing = set(db.session.scalars(select(Document.file_hash).where(Document.file_hash.in_(hashes))))
+        names = set(default_tags)
+        for item, _ in batch:
+            names.update(_tag_names(_metadata(manifest, item.name).get('tags')))
+        tags = {tag.name: tag for tag in resolve_tags(sorted(names))}
+
+        # Pas d'autoflush : les documents du lot partent ensemble au flush
+        with db.session.no_autoflush:
+            for item, (tmp_path, sha256, size) in batch:
+                if skip_existing and (sha256 in existing or sha256 in seen):
+                    discard_staged(tmp_path)
+                    placed.add(tmp_path)
+                    results.append((item, None, 'Contenu déjà présent dans la bibliothèque'))
+                    continue
+                seen.add(sha256)
+                meta = _metadata(manifest, item.name)
+                filename = os.path.basename(item.name)
+                path = store_staged(tmp_path, sha256, size)
+                placed.add(tmp_path)
+                stored.append((sha256, size))
+                tag_names = normalize_tag_names(list(default_tags) + _tag_names(meta.get('tags')))
+                document = Document(
+                    filename=path,
+                    original_filename=filename,
+                    file_hash=sha256,
+                    file_size=size,
+                    title=(meta.get('title') or '').strip() or os.path.splitext(filename)[0],
+                    author=(meta.get('author') or '').strip(),
+                    year=_year(meta.get('year')),
+                    description=(meta.get('description') or '').strip(),
+                    tags=[tags[name] for name in tag_names if name in tags],
+                )
+                document.extracted_text = pending_text(filename)
+                documents.append(document)
+                results.append((item, document, None))
+
+        db.session.add_all(documents)
+        db.session.flush()
+        for document in documents:
+            index_document(document)
+        # Identifiants relevés avant le commit, qui expire les objets
+        report = [Result(item.name, 'exists', None, message) if document is None
+                  else Result(item.name, 'created', document.id, None)
+                  for item, document, message in results]
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Lot d'import annulé : %s", e)
+        for item, (tmp_path, sha256, _) in batch:
+            if tmp_path not in placed:
+                discard_staged(tmp_path)
+            seen.discard(sha256)
+        # Le rollback a retiré les références, pas les fichiers déjà rangés
+        for sha256, size in stored:
+            try:
+                discard_stored(sha256, size)
+            except Exception as cleanup_error:
+                db.session.rollback()
+                logger.error("Contenu %s non supprimé après l'annulation du lot : %s", sha256, cleanup_error)
+        return [Result(item.name, 'error', None, f"Lot annulé : {e}"[:200]) for item, _ in batch]
+
+    logger.info("Import : lot de %d fichiers, %d documents créés", len(batch), len(documents))
+    return report
@@ -1,6 +1,7 @@
-from app import app, db, User
+from app import create_app, db, User
 
 def init_admin():
+    app = create_app()
     with app.app_context():
         # Vérifier si les tables existent
         db.create_all()
@@ -0,0 +1,105 @@
+"""Liste des documents : filtres par tags, année et auteur, tri et pagination par curseur.
+
+Tout le filtrage se fait en SQL. Une page coûte une requête pour les
+documents et une pour leurs tags (selectinload), quel que soit le volume.
+"""
+import base64
+import datetime
+import json
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import selectinload
+
+from models import DOCUMENT_YEAR_SORT, Document, Tag, document_tags
+from tags import normalize_tag_names
+
+# Clés de tri : (expression, sens) ; l'id départage toujours les égalités
+SORTS = {
+    'recent': (Document.upload_date, 'desc'),
+    'year': (DOCUMENT_YEAR_SORT, 'desc'),
+    'title': (Document.title, 'asc'),
+}
+
+
+def encode_cursor(value, item_id):
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, item_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, item_id = json.loads(raw)
+        if sort == 'recent':
+            value = datetime.datetime.fromisoformat(value)
+        return value, int(item_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def tag_filter(tag_names, match):
+    """Sous-requête des documents portant tous (all) ou au moins un (any) des tags"""
+    matching = (select(document_tags.c.document_id)
+                .join(Tag, Tag.id == document_tags.c.tag_id)
+                .where(Tag.name.in_(tag_names)))
+    if match == 'all':
+        matching = (matching
+                    .group_by(document_tags.c.document_id)
+                    .having(func.count() == len(tag_names)))
+    return Document.id.in_(matching)
+
+
+def list_documents(tags=(), match='all', year=None, author=None, sort='recent',
+                   cursor=None, limit=50):
+    """Retourne (documents, curseur de la page suivante)"""
+    if sort not in SORTS:
+        sort = 'recent'
+    key, direction = SORTS[sort]
+    if direction == 'desc':
+        order_by = (key.desc(), Document.id.desc())
+    else:
+        order_by = (key.asc(), Document.id.asc())
+
+    query = (Document.query
+             .options(selectinload(Document.tags))
+             .order_by(*order_by))
+
+    tags = normalize_tag_names(tags)
+    if tags:
+        query = query.filter(tag_filter(tags, match))
+    if year:
+        query = query.filter(Document.year == year)
+    if author:
+        escaped = author.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        query = query.filter(Document.author.ilike(f"%{escaped}%", escape='\\'))
+
+    position = decode_cursor(cursor, sort) if cursor else None
+    if position:
+        value, last_id = position
+        if direction == 'desc':
+            query = query.filter(or_(key < value, and_(key == value, Document.id < last_id)))
+        else:
+            query = query.filter(or_(key > value, and_(key == value, Document.id > last_id)))
+
+    documents = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        last = documents[-1]
+        value = {
+            'recent': last.upload_date,
+            'year': last.year or 0,
+            'title': last.title,
+        }[sort]
+        next_cursor = encode_cursor(value, last.id)
+    return documents, next_cursor
+
+
+def tag_facets():
+    """Tags utilisés et leur nombre de documents (compteurs tenus à jour à l'écriture)"""
+    return (Tag.query
+            .filter(Tag.document_count > 0)
+            .order_by(Tag.name)
+            .all())
@@ -0,0 +1,192 @@
+"""Journalisation asynchrone : les requêtes n'attendent jamais l'écriture des logs.
+
+Les enregistrements passent par une file bornée (QueueHandler) vidée par un
+thread dédié (QueueListener) qui les formate et les écrit. Quand la file est
+pleine, les messages sont abandonnés plutôt que de ralentir la réponse, et
+leur nombre est signalé dès que la file se libère.
+
+Chaque enregistrement porte l'identifiant de la requête (en-tête
+X-Request-ID, repris ou généré) et sort en JSON sur une ligne. Les messages
+INFO et DEBUG d'une route peuvent être échantillonnés (LOG_SAMPLING) ; les
+avertissements et erreurs sont toujours gardés.
+"""
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import traceback
+import uuid
+
+from flask import current_app, g, has_request_context, request
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Identifiants acceptés depuis un proxy : courts et sans caractère de contrôle
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objet JSON par ligne"""
+
+    def format(self, record):
+        data = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+                    .isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key in ('request_id', 'method', 'path', 'endpoint'):
+            value = getattr(record, key, None)
+            if value is not None:
+                data[key] = value
+        if record.exc_info:
+            data['exception'] = ''.join(traceback.format_exception(*record.exc_info)).rstrip()
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _RequestContextFilter(logging.Filter):
+    """Ajoute le contexte de la requête et applique l'échantillonnage (dans le thread appelant)"""
+
+    def filter(self, record):
+        if not has_request_context():
+            return True
+        if record.levelno < logging.WARNING and not g.get('_log_sampled', True):
+            return False
+        record.request_id = g.get('request_id')
+        record.method = request.method
+        record.path = request.path
+        record.endpoint = request.endpoint
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler qui abandonne les messages quand la file est pleine, sans jamais bloquer"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record):
+        # Le message n'est pas formaté ici : le thread d'écriture s'en charge
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return
+        if self.dropped:
+            with self._lock:
+                dropped, self.dropped = self.dropped, 0
+            notice = logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                       "%d messages de journal abandonnés (file pleine)", (dropped,), None)
+            try:
+                self.queue.put_nowait(notice)
+            except queue.Full:
+                with self._lock:
+                    self.dropped += dropped
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # À l'arrêt, on attend que la file se libère pour écrire les derniers messages
+        self.queue.put(self._sentinel)
+
+
+class RequestLogging:
+    """Identifiant de requête, échantillonnage par route et écriture des logs hors des requêtes"""
+
+    def __init__(self, app=None):
+        self.handler = None
+        self.listener = None
+        self._output = None
+        self._hooks_registered = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LOG_LEVEL', os.environ.get('LOG_LEVEL', 'INFO').upper())
+        # 'json' (une ligne JSON par message) ou 'text' (lisible, pour le développement)
+        app.config.setdefault('LOG_FORMAT', os.environ.get('LOG_FORMAT', 'json'))
+        app.config.setdefault('LOG_QUEUE_SIZE', int(os.environ.get('LOG_QUEUE_SIZE', '10000')))
+        # Taux de conservation des messages INFO par endpoint : "main.download_document=0.1,main.login=0.5"
+        app.config.setdefault('LOG_SAMPLING', parse_sampling(os.environ.get('LOG_SAMPLING', '')))
+        self._install(app.config)
+        app.extensions['request_logging'] = self
+        app.before_request(self._start_request)
+        app.after_request(self._end_request)
+
+    def _install(self, config):
+        """Remplace les handlers du logger racine par la file (une seule fois par processus)"""
+        root = logging.getLogger()
+        root.setLevel(config['LOG_LEVEL'])
+        if self.handler is not None and self.handler in root.handlers:
+            return
+        if config['LOG_FORMAT'] == 'json':
+            formatter = JsonFormatter()
+        else:
+            formatter = logging.Formatter('%(asctime)s %(levelname)s [%(name)s] %(message)s')
+        self._output = logging.StreamHandler(sys.stderr)
+        self._output.setFormatter(formatter)
+
+        self.handler = DroppingQueueHandler(queue.Queue(maxsize=config['LOG_QUEUE_SIZE']))
+        self.handler.addFilter(_RequestContextFilter())
+        # Les handlers posés par basicConfig écriraient en direct, dans le thread de la requête
+        for handler in [h for h in root.handlers if type(h) is logging.StreamHandler]:
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        # Thread d'écriture d'une installation précédente (handler retiré entre-temps)
+        self.stop()
+        self._start_listener()
+        if not self._hooks_registered:
+            # Une seule fois par processus : ces hooks ne peuvent pas être retirés et
+            # s'appliquent au handler courant, quel que soit le nombre de create_app()
+            self._hooks_registered = True
+            atexit.register(self.stop)
+            # Après un fork (preload_app), le thread d'écriture n'existe plus dans le worker
+            os.register_at_fork(after_in_child=self._restart_listener)
+
+    def _start_listener(self):
+        self.listener = _QueueListener(self.handler.queue, self._output, respect_handler_level=True)
+        self.listener.start()
+
+    def _restart_listener(self):
+        self.handler.queue = queue.Queue(maxsize=self.handler.queue.maxsize)
+        self._start_listener()
+
+    def stop(self):
+        """Écrit les messages encore en file (fin de processus, tests)"""
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            listener.stop()
+
+    def _start_request(self):
+        request_id = request.headers.get(REQUEST_ID_HEADER, '')
+        g.request_id = request_id if REQUEST_ID_PATTERN.match(request_id) else uuid.uuid4().hex
+        rate = current_app.config['LOG_SAMPLING'].get(request.endpoint, 1.0)
+        g._log_sampled = rate >= 1 or random.random() < rate
+
+    def _end_request(self, response):
+        if 'request_id' in g:
+            response.headers[REQUEST_ID_HEADER] = g.request_id
+        return response
+
+
+def parse_sampling(value):
+    """"endpoint=taux,..." -> {endpoint: taux}"""
+    rates = {}
+    for item in value.split(','):
+        endpoint, _, rate = item.partition('=')
+        if endpoint.strip() and rate.strip():
+            rates[endpoint.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
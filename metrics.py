@@ -0,0 +1,195 @@
+"""Instrumentation des requêtes et exposition des métriques Prometheus.
+
+Pour chaque requête : durée par endpoint, nombre et durée cumulée des
+requêtes SQL (événements du moteur SQLAlchemy), temps de rendu des
+templates et taille de la réponse. Avec plusieurs workers gunicorn,
+PROMETHEUS_MULTIPROC_DIR doit désigner un dossier partagé (voir
+gunicorn.conf.py) : /metrics agrège alors les valeurs de tous les workers.
+
+Les requêtes lentes sont journalisées avec le détail de leurs requêtes SQL,
+les requêtes répétées en premier : c'est la signature d'un N+1.
+"""
+import hmac
+import logging
+import os
+import time
+from collections import Counter
+
+from flask import abort, current_app, g, has_request_context, request
+from flask import before_render_template, template_rendered
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Histogram,
+                               generate_latest, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+SQL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (512, 2048, 8192, 32768, 131072, 524288, 2097152, 8388608, 33554432)
+# Longueur maximale d'une requête SQL dans le journal des requêtes lentes
+SQL_LOG_LENGTH = 500
+
+
+class _Collectors:
+    """Métriques d'une application, dans leur propre registre"""
+
+    def __init__(self):
+        self.registry = CollectorRegistry(auto_describe=True)
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', "Durée de traitement des requêtes",
+            ['method', 'endpoint', 'status'], registry=self.registry)
+        self.response_size = Histogram(
+            'http_response_size_bytes', "Taille des réponses",
+            ['endpoint'], buckets=SIZE_BUCKETS, registry=self.registry)
+        self.sql_statements = Histogram(
+            'db_statements_per_request', "Nombre de requêtes SQL par requête HTTP",
+            ['endpoint'], buckets=SQL_COUNT_BUCKETS, registry=self.registry)
+        self.sql_duration = Histogram(
+            'db_duration_per_request_seconds', "Temps SQL cumulé par requête HTTP",
+            ['endpoint'], registry=self.registry)
+        self.template_duration = Histogram(
+            'template_render_seconds', "Durée de rendu des templates",
+            ['template'], registry=self.registry)
+
+
+def _request_stats():
+    """Compteurs SQL de la requête en cours, ou None hors requête instrumentée"""
+    if not has_request_context():
+        return None
+    return g.get('_metrics_sql')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _request_stats() is not None:
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats()
+    starts = conn.info.get('metrics_query_start')
+    if stats is None or not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    stats['count'] += 1
+    stats['duration'] += elapsed
+    if len(stats['statements']) < current_app.config['METRICS_SLOW_SQL_MAX']:
+        stats['statements'].append((statement, elapsed))
+
+
+def _before_render_template(sender, template, context, **extra):
+    if has_request_context() and '_metrics_start' in g:
+        g.setdefault('_metrics_templates', []).append(time.perf_counter())
+
+
+def _template_rendered(sender, template, context, **extra):
+    if not has_request_context():
+        return
+    starts = g.get('_metrics_templates')
+    if starts:
+        elapsed = time.perf_counter() - starts.pop()
+        sender.extensions['metrics'].template_duration.labels(template.name or 'inline').observe(elapsed)
+
+
+def _counted(chunks, original, histogram):
+    """Transmet les morceaux d'une réponse et observe leur taille totale, même si l'envoi est interrompu"""
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        histogram.observe(size)
+        if hasattr(original, 'close'):
+            original.close()
+
+
+class Metrics:
+    """Instrumentation par requête et route /metrics"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', os.environ.get('METRICS_ENABLED', '1') == '1')
+        # Jeton attendu dans « Authorization: Bearer ... ». Sans jeton, /metrics n'est servi qu'en mode debug
+        app.config.setdefault('METRICS_TOKEN', os.environ.get('METRICS_TOKEN', ''))
+        # Seuil du journal des requêtes lentes, en millisecondes (0 : désactivé)
+        app.config.setdefault('METRICS_SLOW_REQUEST_MS', int(os.environ.get('METRICS_SLOW_REQUEST_MS', '500')))
+        app.config.setdefault('METRICS_SLOW_SQL_MAX', int(os.environ.get('METRICS_SLOW_SQL_MAX', '200')))
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        app.extensions['metrics'] = _Collectors()
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        before_render_template.connect(_before_render_template, app)
+        template_rendered.connect(_template_rendered, app)
+        app.before_request(self._start_request)
+        app.after_request(self._end_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    def _start_request(self):
+        g._metrics_start = time.perf_counter()
+        g._metrics_sql = {'count': 0, 'duration': 0.0, 'statements': []}
+
+    def _end_request(self, response):
+        start = g.pop('_metrics_start', None)
+        stats = g.pop('_metrics_sql', None)
+        if start is None or request.endpoint == 'metrics':
+            return response
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or '<inconnu>'
+        collectors = current_app.extensions['metrics']
+        collectors.request_duration.labels(request.method, endpoint, str(response.status_code)).observe(elapsed)
+        if response.content_length is not None:
+            collectors.response_size.labels(endpoint).observe(response.content_length)
+        elif response.is_streamed:
+            # Réponse envoyée par morceaux (liste des documents) : taille relevée à la fin de l'envoi
+            original = response.response
+            response.response = _counted(response.iter_encoded(), original,
+                                         collectors.response_size.labels(endpoint))
+        collectors.sql_statements.labels(endpoint).observe(stats['count'])
+        collectors.sql_duration.labels(endpoint).observe(stats['duration'])
+
+        threshold = current_app.config['METRICS_SLOW_REQUEST_MS']
+        if threshold and elapsed * 1000 >= threshold:
+            self._log_slow_request(elapsed, response, stats)
+        return response
+
+    def _log_slow_request(self, elapsed, response, stats):
+        lines = [f"Requête lente : {request.method} {request.full_path.rstrip('?')} -> {response.status_code} "
+                 f"en {elapsed * 1000:.0f} ms, {stats['count']} requêtes SQL en {stats['duration'] * 1000:.0f} ms"]
+        statements = [(' '.join(statement.split())[:SQL_LOG_LENGTH], duration)
+                      for statement, duration in stats['statements']]
+        repeated = Counter(statement for statement, _ in statements)
+        for statement, times in repeated.most_common():
+            if times < 2:
+                break
+            lines.append(f"  répétée {times} fois : {statement}")
+        for statement, duration in statements:
+            lines.append(f"  {duration * 1000:7.1f} ms  {statement}")
+        if stats['count'] > len(stats['statements']):
+            lines.append(f"  ... {stats['count'] - len(stats['statements'])} requêtes non détaillées")
+        logger.warning('\n'.join(lines))
+
+    def metrics_view(self):
+        token = current_app.config['METRICS_TOKEN']
+        if not token:
+            if not current_app.debug:
+                # Latences et requêtes SQL par route : jamais publiques en production
+                abort(404)
+        else:
+            supplied = request.headers.get('Authorization', '')
+            if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+                return current_app.response_class('Accès refusé\n', status=401, mimetype='text/plain')
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            # Agrégation des fichiers écrits par tous les workers
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = current_app.extensions['metrics'].registry
+        response = current_app.response_class(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
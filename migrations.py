@@ -0,0 +1,230 @@
+"""Migrations du schéma, versionnées, et contrôle des plans des requêtes de liste.
+
+upgrade() crée les tables manquantes (create_all, avec leurs index), puis
+applique dans l'ordre les migrations dont la version n'est pas encore dans
+schema_version. Chaque migration vérifie l'état de la base avant d'agir : la
+relancer, ou l'appliquer à une base neuve qui a déjà tout, ne fait rien.
+
+check_query_plans() rejoue les pages de liste (accueil, documents triés et
+filtrés), relève leurs requêtes SQL et vérifie avec EXPLAIN qu'elles passent
+par un index plutôt que par un parcours complet de la table suivi d'un tri.
+"""
+import json
+import logging
+import re
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event, func, inspect, select, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex
+
+from models import db, fill_updated_dates, Tag, document_tags
+from search import ensure_search_index, rebuild_search_index
+
+logger = logging.getLogger(__name__)
+
+schema_version = db.Table(
+    'schema_version',
+    db.Column('version', db.Integer, primary_key=True),
+    db.Column('name', db.String(100), nullable=False),
+    db.Column('applied_date', db.DateTime, nullable=False),
+)
+
+
+def _add_columns(connection):
+    """Colonnes ajoutées aux tables depuis leur création (anciennement dans build.sh)"""
+    new_columns = {
+        'article': {'excerpt': 'VARCHAR(300)', 'content_html': 'TEXT', 'render_version': 'INTEGER'},
+        'document': {'file_hash': 'VARCHAR(64)', 'file_size': 'BIGINT'},
+        'tag': {'document_count': 'INTEGER NOT NULL DEFAULT 0'},
+    }
+    inspector = inspect(connection)
+    for table, columns in new_columns.items():
+        existing = {column['name'] for column in inspector.get_columns(table)}
+        for column, column_type in columns.items():
+            if column not in existing:
+                connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}'))
+                if (table, column) == ('tag', 'document_count'):
+                    count = (select(func.count()).select_from(document_tags)
+                             .where(document_tags.c.tag_id == Tag.__table__.c.id).scalar_subquery())
+                    connection.execute(update(Tag.__table__).values(document_count=count))
+
+
+def _create_indexes(connection):
+    """Index des tris et filtres des listes, et de document.file_hash ajouté par la migration 1"""
+    concurrently = connection.dialect.name == 'postgresql'
+    inspector = inspect(connection)
+    for table in db.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for index in table.indexes:
+            if not {column.name for column in index.columns} <= existing:
+                # Colonne ajoutée par une migration suivante, qui créera l'index
+                continue
+            statement = str(CreateIndex(index, if_not_exists=True).compile(connection))
+            if concurrently:
+                # Sans bloquer les écritures (hors transaction, voir upgrade)
+                statement = statement.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1)
+            connection.execute(text(statement))
+
+
+def _add_updated_dates(connection):
+    """Dates de modification des articles et documents (updated_since de l'API), reprises des dates de création"""
+    inspector = inspect(connection)
+    for table in ('article', 'document'):
+        if 'updated_date' not in {column['name'] for column in inspector.get_columns(table)}:
+            connection.execute(text(f'ALTER TABLE {table} ADD COLUMN updated_date TIMESTAMP'))
+    fill_updated_dates(connection)
+    _create_indexes(connection)
+
+
+def _create_search_index(connection):
+    """Index de recherche plein texte (anciennement créé par build.sh et init-db), rempli à sa création"""
+    # Par la session, comme les écritures de l'index ; la connexion de la migration n'a encore rien écrit
+    if ensure_search_index():
+        logger.info("Index de recherche rempli : %d entrées", rebuild_search_index())
+
+
+# (version, nom, fonction, hors transaction sous PostgreSQL)
+MIGRATIONS = (
+    (1, 'colonnes ajoutées', _add_columns, False),
+    (2, 'index des listes', _create_indexes, True),
+    (3, 'dates de modification', _add_updated_dates, True),
+    (4, 'index de recherche', _create_search_index, False),
+)
+
+
+def applied_versions():
+    if not inspect(db.engine).has_table('schema_version'):
+        return set()
+    return set(db.session.scalars(select(schema_version.c.version)))
+
+
+def upgrade():
+    """Met la base à jour. Retourne les noms des migrations appliquées."""
+    db.create_all()
+    done = applied_versions()
+    db.session.rollback()
+    applied = []
+    for version, name, migration, autocommit in MIGRATIONS:
+        if version in done:
+            continue
+        logger.info("Migration %d : %s", version, name)
+        options = {}
+        if autocommit and db.engine.dialect.name == 'postgresql':
+            options['isolation_level'] = 'AUTOCOMMIT'
+        with db.engine.connect().execution_options(**options) as connection:
+            migration(connection)
+            connection.execute(schema_version.insert().values(
+                version=version, name=name, applied_date=datetime.utcnow()))
+            connection.commit()
+        applied.append(name)
+    return applied
+
+
+def pending_migrations():
+    done = applied_versions()
+    return [(version, name) for version, name, _, _ in MIGRATIONS if version not in done]
+
+
+# Pages de liste contrôlées : (nom, URL, tables qui ne doivent pas être parcourues en entier, tri par index exigé)
+PLAN_CHECKS = (
+    ('accueil', '/', ('article',), True),
+    ('documents récents', '/documents', ('document',), True),
+    ('documents par année', '/documents?sort=year', ('document',), True),
+    ('documents par titre', '/documents?sort=title', ('document',), True),
+    ('documents d\'une année', '/documents?year={year}', ('document',), True),
+    ('API, documents modifiés', '/api/v1/documents?fields=id&updated_since=2000-01-01', ('document',), True),
+    # Le planificateur peut partir des liens du tag puis trier ce sous-ensemble
+    ('documents d\'un tag', '/documents?tag={tag}', ('document_tags',), False),
+)
+# Tables dont les pages contrôlées affichent la liste (les tables de PLAN_CHECKS peuvent être jointes)
+LISTED_TABLES = ('article', 'document')
+# SQLite : « SCAN t » parcourt la table, « SCAN t USING INDEX i » tout l'index (dans l'ordre du tri)
+_SQLITE_SCAN = re.compile(r'^SCAN (\w+)( USING (COVERING )?INDEX \w+)?$')
+
+
+def _explain(connection, statement, parameters):
+    """Plan d'une requête : liste de (opération, table) et texte lisible"""
+    if connection.dialect.name == 'postgresql':
+        plan = connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {statement}', parameters).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        steps = []
+
+        def walk(node):
+            steps.append((node['Node Type'], node.get('Relation Name')))
+            for child in node.get('Plans', ()):
+                walk(child)
+
+        walk(plan[0]['Plan'])
+        return steps, json.dumps(plan, indent=1)
+    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+    steps = []
+    for row in rows:
+        detail = row[-1]
+        match = _SQLITE_SCAN.match(detail)
+        if match:
+            steps.append(('Index Scan' if match.group(2) else 'Seq Scan', match.group(1)))
+        elif detail.startswith('USE TEMP B-TREE FOR ORDER BY'):
+            steps.append(('Sort', None))
+        else:
+            steps.append((detail, None))
+    return steps, '\n'.join(row[-1] for row in rows)
+
+
+def _listing_statement(statements):
+    """Requête principale d'une page : le premier SELECT trié et limité sur une table listée"""
+    for statement, parameters in statements:
+        lowered = statement.lower()
+        if ('order by' in lowered and 'limit' in lowered
+                and any(re.search(rf'\bfrom {table}\b', lowered) for table in LISTED_TABLES)):
+            return statement, parameters
+    return None, None
+
+
+def check_query_plans():
+    """Vérifie les plans des pages de liste. Retourne une ligne de rapport par page."""
+    app = current_app._get_current_object()
+    year = db.session.execute(text(
+        'SELECT year FROM document WHERE year IS NOT NULL GROUP BY year ORDER BY COUNT(*) DESC LIMIT 1')).scalar()
+    tag = db.session.execute(text(
+        'SELECT name FROM tag ORDER BY document_count DESC LIMIT 1')).scalar()
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    client = app.test_client()
+    cache_enabled = app.config['PAGE_CACHE_ENABLED']
+    app.config['PAGE_CACHE_ENABLED'] = False
+    event.listen(Engine, 'before_cursor_execute', capture)
+    results = []
+    try:
+        for name, url, tables, ordered in PLAN_CHECKS:
+            if ('{year}' in url and year is None) or ('{tag}' in url and tag is None):
+                results.append({'name': name, 'url': url, 'ok': None, 'problems': ['pas de données'], 'plan': ''})
+                continue
+            url = url.format(year=year, tag=tag)
+            captured.clear()
+            response = client.get(url)
+            response.get_data()
+            statement, parameters = _listing_statement(list(captured))
+            if statement is None:
+                results.append({'name': name, 'url': url, 'ok': False,
+                                'problems': ['requête de liste introuvable'], 'plan': ''})
+                continue
+            with db.engine.connect() as connection:
+                steps, plan = _explain(connection, statement, parameters)
+            # Sans tri par index, parcourir tout un index n'est pas mieux que parcourir la table
+            full_scans = ('Seq Scan',) if ordered else ('Seq Scan', 'Index Scan')
+            problems = [f"parcours complet de {table}" for operation, table in steps
+                        if operation in full_scans and table in tables]
+            if ordered and any(operation == 'Sort' for operation, _ in steps):
+                problems.append("tri hors index")
+            results.append({'name': name, 'url': url, 'ok': not problems, 'problems': problems, 'plan': plan})
+    finally:
+        event.remove(Engine, 'before_cursor_execute', capture)
+        app.config['PAGE_CACHE_ENABLED'] = cache_enabled
+    return results
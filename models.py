@@ -1,20 +1,72 @@
+from collections import defaultdict
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, func, inspect, literal_column, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
 from datetime import datetime
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+# Les lectures des routes publiques peuvent aller sur un réplica (voir replicas.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+def dialect_insert(model):
+    """INSERT du dialecte courant, qui donne accès à ON CONFLICT (SQLite et PostgreSQL)"""
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+def sqlite_engine_options(uri, config):
+    """Options d'engine d'une base SQLite partagée par plusieurs workers"""
+    if ':memory:' in uri or uri.rstrip('/') in ('sqlite:', 'sqlite://'):
+        # Base en mémoire : une seule connexion, le pool par défaut convient
+        return {}
+    return {
+        # Attente des verrous côté pilote, en plus du PRAGMA busy_timeout
+        'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000, 'check_same_thread': False},
+        'poolclass': QueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': 20,
+    }
+
+def configure_sqlite(engine, config):
+    """Réglages appliqués à chaque nouvelle connexion SQLite (WAL : les lectures ne bloquent plus les écritures)"""
+    pragmas = (
+        'PRAGMA journal_mode=WAL',
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT'])}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+        f"PRAGMA cache_size={int(config['SQLITE_CACHE_SIZE'])}",
+        'PRAGMA temp_store=MEMORY',
+    )
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    event.listen(engine, 'connect', set_pragmas)
 
 # Table d'association pour les tags des documents
 document_tags = db.Table('document_tags',
     db.Column('document_id', db.Integer, db.ForeignKey('document.id'), primary_key=True),
-    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True)
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True),
+    # La clé primaire commence par document_id : les filtres par tag ont besoin de cet index
+    db.Index('ix_document_tags_tag_id', 'tag_id', 'document_id')
 )
 
 # Modèle pour les tags
 class Tag(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
+    # Nombre de documents portant le tag, tenu à jour à chaque flush (voir plus bas)
+    document_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     def __repr__(self):
         return f'<Tag {self.name}>'
@@ -24,7 +76,20 @@ class Article(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    # Extrait stocké à l'enregistrement pour ne pas charger le contenu complet dans les listes
+    excerpt = db.Column(db.String(300))
+    # HTML assaini rendu depuis le Markdown à l'enregistrement (voir rendering.py)
+    content_html = db.Column(db.Text)
+    render_version = db.Column(db.Integer)
     created_date = db.Column(db.DateTime, default=datetime.utcnow)
+    # Dernière modification, pour la synchronisation incrémentale de l'API (updated_since)
+    updated_date = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Index des tris et filtres des listes (voir migrations.py pour les bases existantes)
+    __table_args__ = (
+        db.Index('ix_article_created_date', 'created_date', 'id'),
+        db.Index('ix_article_updated_date', 'updated_date', 'id'),
+    )
     
     def __repr__(self):
         return f'<Article {self.title}>'
@@ -39,12 +104,61 @@ class Document(db.Model):
     year = db.Column(db.Integer, nullable=True)
     description = db.Column(db.Text)
     upload_date = db.Column(db.DateTime, default=datetime.utcnow)
-    tags = db.relationship('Tag', secondary=document_tags, lazy='subquery',
+    # Dernière modification, tags compris (voir _collect_tag_count_changes et retag_documents)
+    updated_date = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Empreinte SHA-256 du contenu : filename pointe alors vers le stockage adressé par contenu
+    file_hash = db.Column(db.String(64), db.ForeignKey('stored_file.sha256'), index=True)
+    file_size = db.Column(db.BigInteger)
+    # Chargement à la demande : les listes utilisent selectinload pour charger tous les tags en une requête
+    tags = db.relationship('Tag', secondary=document_tags, lazy='select',
             backref=db.backref('documents', lazy=True))
+    extracted_text = db.relationship('DocumentText', uselist=False, lazy=True,
+            cascade='all, delete-orphan', backref='document')
+
+    __table_args__ = (
+        db.Index('ix_document_upload_date', 'upload_date', 'id'),
+        db.Index('ix_document_year', 'year', 'upload_date', 'id'),
+        db.Index('ix_document_title', 'title', 'id'),
+        db.Index('ix_document_updated_date', 'updated_date', 'id'),
+    )
     
     def __repr__(self):
         return f'<Document {self.title}>'
 
+# Tri par année (listing.SORTS) : la requête doit reprendre exactement cette expression
+DOCUMENT_YEAR_SORT = func.coalesce(Document.year, literal_column('0'))
+db.Index('ix_document_year_sort', DOCUMENT_YEAR_SORT, Document.id)
+
+# Texte brut extrait des fichiers uploadés, rempli en arrière-plan
+class DocumentText(db.Model):
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, done, failed
+    content = db.Column(db.Text)
+    error = db.Column(db.String(500))
+    extracted_date = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<DocumentText {self.document_id} {self.status}>'
+
+# Fichier physique du stockage adressé par contenu, partagé par les documents identiques
+class StoredFile(db.Model):
+    sha256 = db.Column(db.String(64), primary_key=True)
+    path = db.Column(db.String(200), nullable=False)  # clé dans le stockage (relative à UPLOAD_FOLDER sur disque)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<StoredFile {self.sha256} x{self.ref_count}>'
+
+# Contenu d'un fichier du stockage en base (STORAGE_BACKEND=db), découpé en morceaux
+class BlobChunk(db.Model):
+    key = db.Column(db.String(200), primary_key=True)
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    
+    def __repr__(self):
+        return f'<BlobChunk {self.key} #{self.seq}>'
+
 # Modèle pour les utilisateurs
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -59,3 +173,57 @@ class User(UserMixin, db.Model):
     
     def __repr__(self):
         return f'<User {self.username}>'
+
+# Maintenance incrémentale de Tag.document_count : les ajouts et retraits de tags
+# sont relevés avant chaque flush puis appliqués en UPDATE atomiques
+@event.listens_for(Session, 'before_flush')
+def _collect_tag_count_changes(session, flush_context, instances):
+    changes = []
+    with session.no_autoflush:
+        for obj in session.new:
+            if isinstance(obj, Document):
+                changes.extend((tag, 1) for tag in obj.tags)
+        for obj in session.dirty:
+            if isinstance(obj, Document):
+                history = inspect(obj).attrs.tags.history
+                changes.extend((tag, 1) for tag in history.added)
+                changes.extend((tag, -1) for tag in history.deleted)
+                if history.added or history.deleted:
+                    # Seule la table de liaison change : la ligne du document doit dater la modification
+                    obj.updated_date = datetime.utcnow()
+        for obj in session.deleted:
+            if isinstance(obj, Document):
+                changes.extend((tag, -1) for tag in obj.tags)
+    session.info['tag_count_changes'] = changes
+
+@event.listens_for(Session, 'after_flush')
+def _apply_tag_count_changes(session, flush_context):
+    deltas = defaultdict(int)
+    for tag, delta in session.info.pop('tag_count_changes', ()):
+        deltas[tag.id] += delta
+    connection = session.connection()
+    for tag_id, delta in deltas.items():
+        if delta:
+            connection.execute(
+                update(Tag.__table__)
+                .where(Tag.__table__.c.id == tag_id)
+                .values(document_count=Tag.__table__.c.document_count + delta)
+            )
+
+def recount_tags(tag_ids=None):
+    """Recalcule Tag.document_count depuis document_tags (tous les tags ou une sélection)"""
+    count = (select(func.count())
+             .select_from(document_tags)
+             .where(document_tags.c.tag_id == Tag.__table__.c.id)
+             .scalar_subquery())
+    statement = update(Tag.__table__).values(document_count=count)
+    if tag_ids is not None:
+        statement = statement.where(Tag.__table__.c.id.in_(tag_ids))
+    db.session.execute(statement)
+
+def fill_updated_dates(connection):
+    """Date de modification des lignes qui n'en ont pas (bases antérieures, exports importés)"""
+    for table, created in ((Article.__table__, 'created_date'), (Document.__table__, 'upload_date')):
+        connection.execute(update(table)
+                           .where(table.c.updated_date.is_(None))
+                           .values(updated_date=func.coalesce(table.c[created], func.current_timestamp())))
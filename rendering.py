@@ -0,0 +1,95 @@
+"""Rendu des articles : Markdown vers HTML assaini, une fois pour toutes à l'écriture.
+
+Le HTML et l'extrait en texte brut sont enregistrés avec l'article ; les
+pages ne font plus aucune analyse. RENDERER_VERSION est à incrémenter quand
+le rendu change : `flask render-articles` refait alors les articles rendus
+par une version antérieure, en parallèle.
+"""
+import html
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import markdown
+import nh3
+
+RENDERER_VERSION = 1
+MARKDOWN_EXTENSIONS = ['extra', 'sane_lists']
+# Taille des extraits affichés sur la page d'accueil
+EXCERPT_LENGTH = 200
+
+
+def render_markdown(content):
+    """HTML assaini d'un texte Markdown (le HTML déjà présent dans les anciens articles est conservé)"""
+    return nh3.clean(markdown.markdown(content or '', extensions=MARKDOWN_EXTENSIONS))
+
+
+def plain_text(content_html):
+    """Texte brut d'un fragment HTML, espaces normalisés"""
+    return ' '.join(html.unescape(nh3.clean(content_html, tags=set())).split())
+
+
+def make_excerpt(text):
+    """Construit l'extrait affiché dans la liste des articles"""
+    text = text or ''
+    if len(text) > EXCERPT_LENGTH:
+        return text[:EXCERPT_LENGTH] + '...'
+    return text
+
+
+def rendered_fields(content):
+    """Colonnes calculées d'un article à partir de son contenu Markdown"""
+    content_html = render_markdown(content)
+    return {
+        'content_html': content_html,
+        'excerpt': make_excerpt(plain_text(content_html)),
+        'render_version': RENDERER_VERSION,
+    }
+
+
+def render_article(article):
+    for name, value in rendered_fields(article.content).items():
+        setattr(article, name, value)
+
+
+def _render_job(item):
+    article_id, content = item
+    return dict(rendered_fields(content), id=article_id)
+
+
+def render_articles(batch_size=200, workers=1, force=False):
+    """Rend à nouveau les articles dont le rendu est absent ou antérieur. Retourne leur nombre.
+
+    Les lots sont lus par identifiant croissant et enregistrés un par un :
+    la commande peut être interrompue et relancée.
+    """
+    # Import tardif : les processus de rendu n'ont pas besoin de la base
+    from sqlalchemy import or_, update
+    from models import db, Article
+
+    stale = or_(Article.render_version.is_(None), Article.render_version < RENDERER_VERSION)
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    count = 0
+    last_id = 0
+    try:
+        while True:
+            query = db.session.query(Article.id, Article.content).filter(Article.id > last_id)
+            if not force:
+                query = query.filter(stale)
+            batch = query.order_by(Article.id).limit(batch_size).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+            items = [(row.id, row.content) for row in batch]
+            if pool is not None:
+                rows = list(pool.map(_render_job, items, chunksize=max(1, len(items) // (workers * 4))))
+            else:
+                rows = [_render_job(item) for item in items]
+            db.session.execute(update(Article), rows)
+            db.session.commit()
+            count += len(rows)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return count
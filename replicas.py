@@ -0,0 +1,178 @@
+"""Répartition des lectures entre la base principale et des réplicas.
+
+Les réplicas sont déclarés dans DATABASE_REPLICA_URLS (URL séparées par des
+virgules) et deviennent des binds Flask-SQLAlchemy (replica_0, replica_1...).
+Seules les routes publiques marquées @db_routing.read_replica les utilisent ;
+dans ces routes, la session revient sur la base principale dès qu'elle écrit
+(flush, INSERT/UPDATE/DELETE) et y reste jusqu'à la fin de la requête.
+
+Cohérence : un client qui vient d'écrire lit sur la base principale pendant
+DATABASE_REPLICA_MAX_LAG secondes (lire ses propres écritures), et tout le
+monde fait de même après une publication (date de la version du cache des
+pages), pour ne pas mettre en cache des pages périmées. L'état des
+réplicas est vérifié au plus toutes les DATABASE_REPLICA_CHECK_INTERVAL
+secondes : un réplica injoignable, ou en retard de plus de MAX_LAG sur
+PostgreSQL, est écarté et les lectures retombent sur la base principale.
+"""
+import logging
+import os
+import random
+import re
+import threading
+import time
+from functools import partial, wraps
+
+from flask import current_app, g, has_app_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.sql.elements import TextClause
+
+logger = logging.getLogger(__name__)
+
+BIND_PREFIX = 'replica_'
+# Clé de la session Flask : date de la dernière écriture du client
+WRITE_TIME_KEY = '_db_write_time'
+_READ_SQL = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+# Retard de rejeu d'un standby PostgreSQL (0 s'il a tout rejoué ou n'est pas un standby)
+_PG_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def _is_write(clause):
+    if clause is None:
+        return False
+    if isinstance(clause, TextClause):
+        return not _READ_SQL.match(clause.text)
+    return getattr(clause, 'is_dml', False)
+
+
+class RoutingSession(Session):
+    """Session qui lit sur un réplica quand la requête l'autorise"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self.info.get('primary'):
+            if self._flushing or _is_write(clause):
+                # Tout ce qui suit une écriture reste sur la base principale
+                self.info['primary'] = True
+            elif has_app_context():
+                replica = g.get('_db_replica')
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouting:
+    """Binds des réplicas, état de santé par processus et décorateur des routes en lecture"""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """À appeler avant db.init_app : les réplicas sont ajoutés à SQLALCHEMY_BINDS"""
+        urls = app.config.get('DATABASE_REPLICA_URLS', os.environ.get('DATABASE_REPLICA_URLS', ''))
+        if isinstance(urls, str):
+            urls = [url.strip() for url in urls.split(',') if url.strip()]
+        urls = [url.replace('postgres://', 'postgresql://', 1) if url.startswith('postgres://') else url
+                for url in urls]
+        app.config['DATABASE_REPLICA_URLS'] = urls
+        app.config.setdefault('DATABASE_REPLICA_MAX_LAG', float(os.environ.get('DATABASE_REPLICA_MAX_LAG', '5')))
+        app.config.setdefault('DATABASE_REPLICA_CHECK_INTERVAL',
+                              float(os.environ.get('DATABASE_REPLICA_CHECK_INTERVAL', '10')))
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        for number, url in enumerate(urls):
+            binds[f'{BIND_PREFIX}{number}'] = url
+        app.config['SQLALCHEMY_BINDS'] = binds
+        app.extensions['db_routing'] = self
+        # État de santé par engine de réplica, propre à l'application : engine -> (sain, prochaine vérification)
+        app.extensions['db_routing_health'] = {}
+        if urls:
+            app.after_request(self._remember_write)
+
+    def read_replica(self, view):
+        """Décorateur : les lectures de la route peuvent aller sur un réplica"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method in ('GET', 'HEAD'):
+                g._db_replica = self.choose()
+            return view(*args, **kwargs)
+        return wrapper
+
+    def choose(self):
+        """Engine d'un réplica utilisable, ou None pour la base principale"""
+        config = current_app.config
+        if not config['DATABASE_REPLICA_URLS']:
+            return None
+        max_lag = config['DATABASE_REPLICA_MAX_LAG']
+        written = session.get(WRITE_TIME_KEY)
+        if written and time.time() - written < max_lag:
+            return None
+        # Juste après une publication, une page mise en cache depuis un réplica en retard resterait périmée
+        page_cache = current_app.extensions.get('page_cache')
+        if page_cache is not None:
+            _, last_write = page_cache.version()
+            if time.time() - last_write.timestamp() < max_lag + 1:
+                return None
+        engines = current_app.extensions['sqlalchemy'].engines
+        healthy = [engines[key] for key in self._replica_keys(config) if self._healthy(key, engines[key])]
+        return random.choice(healthy) if healthy else None
+
+    @staticmethod
+    def _replica_keys(config):
+        return [f'{BIND_PREFIX}{number}' for number in range(len(config['DATABASE_REPLICA_URLS']))]
+
+    def _healthy(self, key, engine):
+        now = time.monotonic()
+        interval = current_app.config['DATABASE_REPLICA_CHECK_INTERVAL']
+        health = current_app.extensions['db_routing_health']
+        with self._lock:
+            state = health.get(engine)
+            if state is None:
+                # Première vérification : écarte le réplica dès qu'une connexion est perdue
+                event.listen(engine, 'handle_error', partial(self._on_error, health))
+            elif now < state[1]:
+                return state[0]
+            # Un seul thread vérifie ; les autres gardent l'état précédent en attendant
+            health[engine] = (state[0] if state else False, now + interval)
+        healthy = self._check(key, engine)
+        with self._lock:
+            health[engine] = (healthy, now + interval)
+        return healthy
+
+    def _check(self, key, engine):
+        try:
+            if engine.dialect.name == 'sqlite' and not os.path.exists(engine.url.database or ''):
+                # SQLite créerait un fichier vide à la connexion
+                raise FileNotFoundError(engine.url.database)
+            with engine.connect() as connection:
+                if engine.dialect.name == 'postgresql':
+                    lag = float(connection.execute(_PG_LAG_SQL).scalar() or 0)
+                else:
+                    connection.execute(text('SELECT 1'))
+                    lag = 0.0
+        except Exception as e:
+            logger.warning("Réplica %s indisponible, lectures sur la base principale : %s", key, e)
+            return False
+        if lag > current_app.config['DATABASE_REPLICA_MAX_LAG']:
+            logger.warning("Réplica %s en retard de %.1f s, écarté", key, lag)
+            return False
+        return True
+
+    def _on_error(self, health, context):
+        # Connexion perdue en cours de requête : le réplica est écarté jusqu'à la prochaine vérification
+        if context.is_disconnect and context.engine is not None:
+            with self._lock:
+                state = health.get(context.engine)
+                if state is not None:
+                    health[context.engine] = (False, state[1])
+
+    def _remember_write(self, response):
+        """Après une écriture, le client lit sur la base principale le temps que les réplicas la reçoivent"""
+        db = current_app.extensions['sqlalchemy']
+        if request.method not in ('GET', 'HEAD') and db.session.info.get('primary'):
+            session[WRITE_TIME_KEY] = time.time()
+        return response
+
@@ -0,0 +1,220 @@
+"""Index de recherche plein texte des articles et des documents.
+
+SQLite utilise une table virtuelle FTS5, PostgreSQL une table avec une
+colonne tsvector indexée en GIN. Les deux variantes partagent le même
+identifiant de ligne : id * 2 pour un article, id * 2 + 1 pour un document.
+"""
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import text
+from sqlalchemy.orm import selectinload
+
+from models import db
+from rendering import plain_text
+
+# Marqueurs de surlignage remplacés par <mark> après échappement
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+KINDS = {'article': 0, 'document': 1}
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def _row_id(kind, ref_id):
+    return ref_id * 2 + KINDS[kind]
+
+
+def ensure_search_index():
+    """Crée la structure d'index si besoin. Retourne True si elle vient d'être créée."""
+    if _dialect() == 'postgresql':
+        exists = db.session.execute(text("SELECT to_regclass('search_index')")).scalar()
+        if exists:
+            return False
+        db.session.execute(text(
+            'CREATE TABLE search_index ('
+            ' id BIGINT PRIMARY KEY,'
+            ' title TEXT NOT NULL,'
+            ' body TEXT NOT NULL,'
+            ' tags TEXT NOT NULL,'
+            ' tsv TSVECTOR NOT NULL)'
+        ))
+        db.session.execute(text('CREATE INDEX ix_search_index_tsv ON search_index USING GIN (tsv)'))
+    else:
+        exists = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+        )).scalar()
+        if exists:
+            return False
+        db.session.execute(text(
+            'CREATE VIRTUAL TABLE search_index USING fts5('
+            "title, body, tags, tokenize = 'unicode61 remove_diacritics 2')"
+        ))
+    db.session.commit()
+    return True
+
+
+def _upsert(kind, ref_id, title, body, tags):
+    params = {
+        'id': _row_id(kind, ref_id),
+        'title': title or '',
+        # Texte brut : espaces réduits seulement (un « < » dans un document n'est pas une balise)
+        'body': ' '.join((body or '').split()),
+        'tags': tags or '',
+    }
+    if _dialect() == 'postgresql':
+        db.session.execute(text(
+            'INSERT INTO search_index (id, title, body, tags, tsv) VALUES ('
+            ' :id, :title, :body, :tags,'
+            " setweight(to_tsvector('french', :title), 'A') ||"
+            " setweight(to_tsvector('french', :tags), 'B') ||"
+            " setweight(to_tsvector('french', :body), 'C'))"
+            ' ON CONFLICT (id) DO UPDATE SET'
+            ' title = EXCLUDED.title, body = EXCLUDED.body,'
+            ' tags = EXCLUDED.tags, tsv = EXCLUDED.tsv'
+        ), params)
+    else:
+        # FTS5 ne gère pas l'UPSERT : suppression puis insertion sur le même rowid
+        db.session.execute(text('DELETE FROM search_index WHERE rowid = :id'), params)
+        db.session.execute(text(
+            'INSERT INTO search_index (rowid, title, body, tags) VALUES (:id, :title, :body, :tags)'
+        ), params)
+
+
+def document_body(document):
+    """Texte indexé pour un document : métadonnées libres et texte extrait du fichier"""
+    parts = [document.author, document.description]
+    if document.extracted_text is not None:
+        parts.append(document.extracted_text.content)
+    return ' '.join(part for part in parts if part)
+
+
+def index_article(article):
+    """Indexe un article. Doit être appelé après un flush pour disposer de l'id."""
+    # Seul le HTML rendu des articles passe par plain_text
+    body = plain_text(article.content_html) if article.content_html else article.content
+    _upsert('article', article.id, article.title, body, '')
+
+
+def index_document(document):
+    """Indexe un document et les noms de ses tags"""
+    tags = ' '.join(tag.name for tag in document.tags)
+    _upsert('document', document.id, document.title, document_body(document), tags)
+
+
+def remove_from_index(kind, ref_id):
+    key = 'id' if _dialect() == 'postgresql' else 'rowid'
+    db.session.execute(text(f'DELETE FROM search_index WHERE {key} = :id'),
+                       {'id': _row_id(kind, ref_id)})
+
+
+def rebuild_search_index(batch_size=500):
+    """Reconstruit entièrement l'index à partir des tables"""
+    from models import Article, Document
+
+    ensure_search_index()
+    db.session.execute(text('DELETE FROM search_index'))
+    count = 0
+    for article in Article.query.order_by(Article.id).yield_per(batch_size):
+        index_article(article)
+        count += 1
+    documents = Document.query.options(selectinload(Document.extracted_text)).order_by(Document.id)
+    for document in documents.yield_per(batch_size):
+        index_document(document)
+        count += 1
+    db.session.commit()
+    return count
+
+
+def _encode_cursor(score, row_id):
+    return f"{score!r}_{row_id}"
+
+
+def _decode_cursor(cursor):
+    try:
+        score, row_id = cursor.rsplit('_', 1)
+        return float(score), int(row_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _fts5_query(query):
+    """Transforme la saisie utilisateur en requête FTS5 sûre (préfixes, ET implicite)"""
+    words = _WORD_RE.findall(query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _highlight(value):
+    """Échappe le texte puis convertit les marqueurs de surlignage en <mark>"""
+    escaped = str(escape(value or ''))
+    return Markup(escaped.replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>'))
+
+
+def search_entries(query, kind=None, cursor=None, limit=20):
+    """Recherche classée par pertinence.
+
+    Retourne (résultats, curseur suivant). Chaque résultat contient kind, id,
+    title et snippet (Markup avec surlignage).
+    """
+    position = _decode_cursor(cursor) if cursor else None
+    params = {'limit': limit + 1}
+    filters = []
+    if kind in KINDS:
+        filters.append('id % 2 = :parity')
+        params['parity'] = KINDS[kind]
+    if position:
+        # Score décroissant puis id croissant
+        filters.append('(score < :score OR (score = :score AND id > :last_id))')
+        params['score'], params['last_id'] = position
+    where = ('WHERE ' + ' AND '.join(filters)) if filters else ''
+
+    if _dialect() == 'postgresql':
+        params['q'] = query
+        sql = (
+            'WITH hits AS ('
+            ' SELECT id, ts_rank_cd(tsv, q) AS score FROM search_index,'
+            " websearch_to_tsquery('french', :q) AS q WHERE tsv @@ q),"
+            ' page AS ('
+            f' SELECT id, score FROM hits {where} ORDER BY score DESC, id LIMIT :limit)'
+            ' SELECT page.id, page.score,'
+            " ts_headline('french', s.title, q, :title_opts) AS title,"
+            " ts_headline('french', s.body, q, :body_opts) AS snippet"
+            " FROM page JOIN search_index s ON s.id = page.id,"
+            " websearch_to_tsquery('french', :q) AS q"
+            ' ORDER BY page.score DESC, page.id'
+        )
+        params['title_opts'] = f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, HighlightAll=true'
+        params['body_opts'] = (f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END},'
+                               ' MaxWords=35, MinWords=15, MaxFragments=2')
+    else:
+        params['q'] = _fts5_query(query)
+        if not params['q']:
+            return [], None
+        # bm25 : plus la valeur est basse, plus le résultat est pertinent
+        sql = (
+            'SELECT id, score, title, snippet FROM ('
+            ' SELECT rowid AS id, -bm25(search_index, 10.0, 1.0, 5.0) AS score,'
+            f" highlight(search_index, 0, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}') AS title,"
+            f" snippet(search_index, 1, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', 30) AS snippet"
+            ' FROM search_index WHERE search_index MATCH :q)'
+            f' {where} ORDER BY score DESC, id LIMIT :limit'
+        )
+
+    rows = db.session.execute(text(sql), params).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].score, rows[-1].id)
+
+    results = [{
+        'kind': 'document' if row.id % 2 else 'article',
+        'id': row.id // 2,
+        'title': _highlight(row.title),
+        'snippet': _highlight(row.snippet),
+    } for row in rows]
+    return results, next_cursor
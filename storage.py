@@ -0,0 +1,401 @@
+"""Stockage des fichiers adressé par contenu.
+
+Les uploads sont écrits par blocs dans un fichier temporaire pendant le
+calcul de leur SHA-256, puis rangés sous la clé objects/<aa>/<bb>/<sha256>
+du backend configuré (voir backends.py : disque, base ou S3). Un même
+contenu n'est stocké qu'une fois : StoredFile garde le nombre de documents
+qui le référencent.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+import time
+import unicodedata
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from flask import current_app, send_file
+from sqlalchemy import delete, inspect, select, text, update
+
+from models import db, dialect_insert, StoredFile
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+OBJECTS_FOLDER = 'objects'
+TMP_FOLDER = 'tmp'
+
+
+def object_path(sha256):
+    """Chemin relatif à UPLOAD_FOLDER d'un contenu"""
+    return f"{OBJECTS_FOLDER}/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+def absolute_path(relative_path):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], relative_path)
+
+
+def _write_chunks(chunks):
+    """Écrit les blocs dans un fichier temporaire. Retourne (chemin, sha256, taille)."""
+    tmp_folder = absolute_path(TMP_FOLDER)
+    os.makedirs(tmp_folder, exist_ok=True)
+    tmp_path = os.path.join(tmp_folder, uuid.uuid4().hex)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+
+def read_chunks(stream):
+    return iter(lambda: stream.read(CHUNK_SIZE), b'')
+
+
+def _add_reference(sha256, size):
+    """Compte une référence de plus, en créant la ligne si besoin (atomique)"""
+    statement = dialect_insert(StoredFile).values(
+        sha256=sha256, path=object_path(sha256), size=size, ref_count=1
+    ).on_conflict_do_update(
+        index_elements=['sha256'],
+        set_={'ref_count': StoredFile.ref_count + 1}
+    )
+    db.session.execute(statement)
+
+
+def _place(tmp_path, sha256):
+    """Range le fichier temporaire dans le backend (un contenu déjà stocké n'est pas réécrit)"""
+    current_app.extensions['storage'].put(object_path(sha256), tmp_path)
+
+
+def stage_chunks(chunks):
+    """Écrit et hache un contenu sans toucher à la base (utilisable depuis un thread).
+
+    Retourne (chemin temporaire, sha256, taille) pour store_staged() ou discard_staged().
+    """
+    return _write_chunks(chunks)
+
+
+def store_staged(tmp_path, sha256, size):
+    """Range un contenu préparé par stage_chunks(). Retourne son chemin relatif.
+
+    La référence est ajoutée dans la transaction courante : l'appelant commit.
+    """
+    try:
+        _add_reference(sha256, size)
+        _place(tmp_path, sha256)
+    except BaseException:
+        discard_staged(tmp_path)
+        raise
+    return object_path(sha256)
+
+
+def discard_staged(tmp_path):
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+
+def store_chunks(chunks):
+    """Stocke un contenu fourni par blocs. Retourne (chemin relatif, sha256, taille).
+
+    La référence est ajoutée dans la transaction courante : l'appelant commit.
+    """
+    tmp_path, sha256, size = stage_chunks(chunks)
+    return store_staged(tmp_path, sha256, size), sha256, size
+
+
+def store_upload(file):
+    """Stocke un FileStorage sans le charger en mémoire"""
+    return store_chunks(read_chunks(file.stream))
+
+
+def release(sha256):
+    """Retire une référence. Retourne True si le contenu n'est plus utilisé.
+
+    La ligne reste, à zéro référence : le fichier et la ligne ne sont
+    supprimés que par purge(), après le commit.
+    """
+    db.session.execute(
+        update(StoredFile)
+        .where(StoredFile.sha256 == sha256)
+        .values(ref_count=StoredFile.ref_count - 1)
+    )
+    ref_count = db.session.scalar(select(StoredFile.ref_count).where(StoredFile.sha256 == sha256))
+    return ref_count is not None and ref_count <= 0
+
+
+def purge(sha256):
+    """Supprime le fichier d'un contenu qui n'est plus référencé. Retourne True s'il a été supprimé.
+
+    La ligne est supprimée seulement si elle est toujours à zéro référence, et
+    le fichier effacé avant le commit : un upload concurrent du même contenu
+    attend le verrou de la ligne, puis la recrée et réécrit le fichier. S'il
+    l'a emporté, la ligne n'est plus à zéro et rien n'est supprimé.
+    """
+    result = db.session.execute(
+        delete(StoredFile)
+        .where(StoredFile.sha256 == sha256)
+        .where(StoredFile.ref_count <= 0)
+    )
+    if result.rowcount == 0:
+        db.session.rollback()
+        return False
+    try:
+        current_app.extensions['file_index'].forget(object_path(sha256))
+        current_app.extensions['storage'].delete(object_path(sha256))
+        # Backend db : la suppression des blocs passe aussi par la session
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+    return True
+
+
+def discard_stored(sha256, size):
+    """Après l'annulation de la transaction qui a rangé un contenu : le supprime s'il n'est pas référencé ailleurs.
+
+    La ligne est recréée à zéro référence si le rollback l'a emportée, puis
+    purge() décide comme pour une suppression : un upload concurrent du même
+    contenu garde son fichier.
+    """
+    db.session.execute(
+        dialect_insert(StoredFile)
+        .values(sha256=sha256, path=object_path(sha256), size=size, ref_count=0)
+        .on_conflict_do_nothing(index_elements=['sha256'])
+    )
+    db.session.commit()
+    return purge(sha256)
+
+
+class FileIndex:
+    """Index en mémoire des fichiers présents, pour ne pas interroger le stockage à chaque téléchargement.
+
+    Un fichier du stockage adressé par contenu ne change jamais : sa présence
+    est mémorisée jusqu'à purge(). Les absences ne sont gardées que quelques
+    secondes, le temps qu'un upload concurrent se termine.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FILE_INDEX_MAX_ENTRIES', int(os.environ.get('FILE_INDEX_MAX_ENTRIES', '100000')))
+        app.config.setdefault('FILE_INDEX_MISSING_TTL', float(os.environ.get('FILE_INDEX_MISSING_TTL', '5')))
+        app.extensions['file_index'] = self
+        # Présences et absences connues, propres à l'application
+        app.extensions['file_index_entries'] = (set(), {})
+
+    def exists(self, relative_path):
+        now = time.monotonic()
+        present, missing = current_app.extensions['file_index_entries']
+        with self._lock:
+            if relative_path in present:
+                return True
+            if missing.get(relative_path, 0) > now:
+                return False
+        found = current_app.extensions['storage'].exists(relative_path)
+        with self._lock:
+            if found:
+                if len(present) >= current_app.config['FILE_INDEX_MAX_ENTRIES']:
+                    present.clear()
+                present.add(relative_path)
+                missing.pop(relative_path, None)
+            else:
+                if len(missing) >= current_app.config['FILE_INDEX_MAX_ENTRIES']:
+                    missing.clear()
+                missing[relative_path] = now + current_app.config['FILE_INDEX_MISSING_TTL']
+        return found
+
+    def forget(self, relative_path):
+        present, missing = current_app.extensions['file_index_entries']
+        with self._lock:
+            present.discard(relative_path)
+            missing.pop(relative_path, None)
+
+
+def _set_attachment(response, download_name):
+    """En-tête Content-Disposition, avec filename* pour les noms non ASCII (comme send_file)"""
+    try:
+        download_name.encode('ascii')
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        response.headers.set('Content-Disposition', 'attachment', filename=simple,
+                             **{'filename*': f"UTF-8''{quote(download_name, safe='')}"})
+
+
+def send_stored_file(relative_path, download_name, etag=None):
+    """Réponse de téléchargement d'un fichier du stockage.
+
+    Selon DOWNLOAD_OFFLOAD, le transfert est confié au proxy (X-Accel-Redirect
+    pour nginx, X-Sendfile pour Apache) ; sinon send_file gère Range/If-Range
+    et le serveur WSGI utilise sendfile via wsgi.file_wrapper. L'ETag fort
+    est l'empreinte SHA-256 du contenu quand elle est connue. Un fichier
+    d'un backend distant est envoyé depuis le cache local.
+    """
+    config = current_app.config
+    max_age = config['DOWNLOAD_MAX_AGE']
+    path = current_app.extensions['storage'].local_path(relative_path)
+    # Chemin vu par nginx : la location interne pointe vers UPLOAD_FOLDER
+    accel_path = os.path.relpath(path, config['UPLOAD_FOLDER']).replace(os.sep, '/')
+    if config['DOWNLOAD_OFFLOAD'] == 'x-accel-redirect' and not accel_path.startswith('..'):
+        response = current_app.response_class(
+            mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+        )
+        response.headers['X-Accel-Redirect'] = config['DOWNLOAD_ACCEL_PREFIX'].rstrip('/') + '/' + quote(accel_path)
+        _set_attachment(response, download_name)
+        if etag:
+            response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        return response
+
+    # X-Sendfile est pris en charge directement par send_file (USE_X_SENDFILE)
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name=download_name,
+        etag=etag or True,
+        conditional=True,
+        max_age=max_age
+    )
+
+
+def _legacy_blob_chunks(document_id, length):
+    """Lit une colonne file_content (BYTEA) par morceaux, sans la charger en entier"""
+    for offset in range(1, length + 1, CHUNK_SIZE):
+        yield db.session.execute(
+            text('SELECT substr(file_content, :offset, :size) FROM document WHERE id = :id'),
+            {'offset': offset, 'size': CHUNK_SIZE, 'id': document_id}
+        ).scalar()
+
+
+def migrate_legacy_files(batch_size=100):
+    """Range les anciens fichiers d'uploads/ et les blobs file_content dans le stockage.
+
+    Seuls les documents sans file_hash sont traités : la commande peut être relancée.
+    Retourne (migrés, introuvables).
+    """
+    from models import Document
+
+    columns = [c['name'] for c in inspect(db.engine).get_columns('document')]
+    has_blob_column = 'file_content' in columns
+    migrated = missing = 0
+    last_id = 0
+    while True:
+        batch = (Document.query
+                 .filter(Document.file_hash.is_(None), Document.id > last_id)
+                 .order_by(Document.id)
+                 .limit(batch_size)
+                 .all())
+        if not batch:
+            break
+        last_id = batch[-1].id
+        legacy_paths = set()
+        for document in batch:
+            legacy_path = absolute_path(document.filename)
+            if os.path.isfile(legacy_path):
+                with open(legacy_path, 'rb') as f:
+                    path, sha256, size = store_chunks(read_chunks(f))
+                legacy_paths.add(legacy_path)
+            else:
+                length = None
+                if has_blob_column:
+                    length = db.session.execute(
+                        text('SELECT length(file_content) FROM document WHERE id = :id'),
+                        {'id': document.id}
+                    ).scalar()
+                if not length:
+                    logger.warning(f"Fichier introuvable pour le document {document.id} : {document.filename}")
+                    missing += 1
+                    continue
+                path, sha256, size = store_chunks(_legacy_blob_chunks(document.id, length))
+                db.session.execute(text('UPDATE document SET file_content = NULL WHERE id = :id'),
+                                   {'id': document.id})
+            document.filename = path
+            document.file_hash = sha256
+            document.file_size = size
+            migrated += 1
+        db.session.commit()
+        # Les anciens fichiers ne sont supprimés qu'une fois le lot enregistré
+        for legacy_path in legacy_paths:
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
+        logger.info(f"Stockage : {migrated} documents migrés (jusqu'au document {last_id})")
+    return migrated, missing
+
+
+def _copy_object(app, sha256, key, source, target, delete_source):
+    """Dans un thread : copie un contenu d'un backend à l'autre, vérifié par son SHA-256"""
+    with app.app_context():
+        if target.exists(key):
+            status = 'skipped'
+        else:
+            try:
+                tmp_path, digest, _ = stage_chunks(source.read_chunks(key))
+            except FileNotFoundError:
+                return 'missing'
+            try:
+                if digest != sha256:
+                    raise ValueError(f"Empreinte différente pour {key} : {digest}")
+                target.put(key, tmp_path)
+            finally:
+                discard_staged(tmp_path)
+            status = 'copied'
+        if delete_source:
+            source.delete(key)
+        # Backend db : écritures et suppressions passent par la session de ce thread
+        db.session.commit()
+        return status
+
+
+def migrate_storage(source_name, target_name, workers=8, batch_size=500, delete_source=False):
+    """Copie tous les contenus référencés d'un backend à l'autre, en parallèle.
+
+    Les contenus déjà présents dans la cible sont passés : la commande peut
+    être relancée. Retourne le nombre de contenus par statut (copied,
+    skipped, missing, error).
+    """
+    storage = current_app.extensions['storage']
+    source = storage.backend(source_name)
+    target = storage.backend(target_name)
+    app = current_app._get_current_object()
+    counts = dict.fromkeys(('copied', 'skipped', 'missing', 'error'), 0)
+    last_sha256 = ''
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        while True:
+            rows = db.session.execute(
+                select(StoredFile.sha256, StoredFile.path)
+                .where(StoredFile.sha256 > last_sha256)
+                .order_by(StoredFile.sha256)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_sha256 = rows[-1].sha256
+            futures = [(path, pool.submit(_copy_object, app, sha256, path, source, target, delete_source))
+                       for sha256, path in rows]
+            for path, future in futures:
+                try:
+                    status = future.result()
+                except Exception as e:
+                    logger.error(f"Copie de {path} impossible : {str(e)}")
+                    status = 'error'
+                if status == 'missing':
+                    logger.warning(f"Contenu absent de {source_name} : {path}")
+                counts[status] += 1
+            db.session.rollback()
+            logger.info(f"Stockage : {sum(counts.values())} contenus traités (jusqu'à {last_sha256[:12]})")
+    return counts
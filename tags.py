@@ -0,0 +1,99 @@
+"""Résolution ensembliste des tags et re-étiquetage en masse.
+
+Les noms sont résolus en une requête IN ; les tags manquants sont créés
+par un INSERT ... ON CONFLICT DO NOTHING, ce qui rend la création sûre face
+aux uploads concurrents (contrainte unique sur Tag.name).
+"""
+from datetime import datetime
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import selectinload
+
+from models import db, dialect_insert, Document, Tag, document_tags, recount_tags
+
+TAG_NAME_LENGTH = 50
+# Lignes document_tags insérées par requête lors d'un re-étiquetage
+LINK_BATCH_SIZE = 1000
+
+
+def normalize_tag_names(names):
+    """Noms de tags nettoyés (espaces, longueur), sans doublon, dans l'ordre"""
+    result = []
+    for name in names:
+        name = ' '.join((name or '').split())[:TAG_NAME_LENGTH].strip()
+        if name and name not in result:
+            result.append(name)
+    return result
+
+
+def parse_tag_names(value):
+    """Liste de noms depuis un champ de formulaire « tag1, tag2 »"""
+    return normalize_tag_names((value or '').split(','))
+
+
+def resolve_tags(names, create=True):
+    """Retourne les Tag correspondant aux noms, dans l'ordre, en créant les manquants.
+
+    Une requête si tous les tags existent, deux sinon (trois si un upload
+    concurrent a créé le même tag entre-temps).
+    """
+    names = normalize_tag_names(names)
+    if not names:
+        return []
+    found = {tag.name: tag for tag in Tag.query.filter(Tag.name.in_(names))}
+    missing = [name for name in names if name not in found]
+    if missing and create:
+        statement = (dialect_insert(Tag)
+                     .on_conflict_do_nothing(index_elements=['name'])
+                     .returning(Tag))
+        created = db.session.scalars(statement, [{'name': name} for name in missing]).all()
+        found.update((tag.name, tag) for tag in created)
+        if len(created) < len(missing):
+            # Tags insérés par une autre transaction : relecture
+            lost = [name for name in missing if name not in found]
+            found.update((tag.name, tag) for tag in Tag.query.filter(Tag.name.in_(lost)))
+    return [found[name] for name in names if name in found]
+
+
+def retag_documents(document_ids, add=(), remove=()):
+    """Ajoute et retire des tags sur un ensemble de documents, dans la transaction courante.
+
+    Les liens sont écrits en SQL ensembliste, puis les compteurs des tags
+    concernés sont recalculés. Retourne les documents modifiés, tags chargés.
+    """
+    document_ids = set(document_ids)
+    if not document_ids:
+        return []
+    # Identifiants inconnus ignorés : pas de lien orphelin, compté ensuite par recount_tags
+    document_ids = db.session.scalars(
+        select(Document.id).where(Document.id.in_(document_ids)).order_by(Document.id)).all()
+    if not document_ids:
+        return []
+    add_tags = resolve_tags(add)
+    remove_tags = resolve_tags(remove, create=False)
+
+    if add_tags:
+        links = [{'document_id': document_id, 'tag_id': tag.id}
+                 for document_id in document_ids for tag in add_tags]
+        for start in range(0, len(links), LINK_BATCH_SIZE):
+            db.session.execute(
+                dialect_insert(document_tags)
+                .values(links[start:start + LINK_BATCH_SIZE])
+                .on_conflict_do_nothing(index_elements=['document_id', 'tag_id'])
+            )
+    if remove_tags:
+        db.session.execute(
+            delete(document_tags)
+            .where(document_tags.c.document_id.in_(document_ids))
+            .where(document_tags.c.tag_id.in_([tag.id for tag in remove_tags]))
+        )
+
+    recount_tags([tag.id for tag in add_tags + remove_tags])
+    db.session.execute(update(Document).where(Document.id.in_(document_ids)).values(updated_date=datetime.utcnow()))
+    # Les collections déjà chargées sont périmées après ces écritures directes
+    return db.session.scalars(
+        select(Document)
+        .where(Document.id.in_(document_ids))
+        .options(selectinload(Document.tags))
+        .execution_options(populate_existing=True)
+    ).all()
@@ -1,12 +1,28 @@
 import os
-from app import app, db
-from models import User, Article, Document, Tag
+import pytest
+from app import create_app, db
+from models import User, Article, Document, DocumentText, Tag
+from migrations import upgrade, check_query_plans
+from search import index_document, search_entries
+from benchmark import run_stress, seed_corpus
 
-def test_environment():
+@pytest.fixture
+def app(tmp_path):
+    """Application sur une base et un dossier d'instance temporaires : rien n'est écrit dans le dépôt"""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'blog.db'}",
+        'PAGE_CACHE_DIR': str(tmp_path),
+        'JINJA_CACHE_DIR': str(tmp_path / 'jinja_cache'),
+    })
+    with app.app_context():
+        upgrade()
+    return app
+
+def test_environment(app):
     """Vérifie l'environnement de l'application"""
     print("\n=== Test de l'environnement ===")
     print(f"Mode Debug : {app.debug}")
-    print(f"Base de données : {app.config['SQLALCHEMY_DATABASE_URL']}")
+    print(f"Base de données : {app.config['SQLALCHEMY_DATABASE_URI']}")
     print(f"Dossier uploads : {app.config['UPLOAD_FOLDER']}")
     
     # Vérification du dossier uploads
@@ -17,7 +33,7 @@ def test_environment():
     else:
         print("❌ Le dossier uploads n'existe pas")
 
-def test_database():
+def test_database(app):
     """Vérifie la base de données"""
     print("\n=== Test de la base de données ===")
     with app.app_context():
@@ -42,7 +58,7 @@ def test_database():
         except Exception as e:
             print(f"❌ Erreur de base de données : {str(e)}")
 
-def test_routes():
+def test_routes(app):
     """Vérifie les routes principales"""
     print("\n=== Test des routes ===")
     with app.test_client() as client:
@@ -58,8 +74,49 @@ def test_routes():
         response = client.get('/admin')
         print(f"Route /admin : {response.status_code}")
 
+        # Test de l'API JSON
+        response = client.get('/api/v1/documents?fields=id,title&limit=5')
+        print(f"Route /api/v1/documents : {response.status_code}")
+
+def test_sqlite_concurrency(tmp_path):
+    """Vérifie que SQLite supporte des écritures et lectures simultanées (plusieurs processus)"""
+    print("\n=== Test de concurrence SQLite ===")
+    results = run_stress(str(tmp_path / 'stress.db'), duration=2, writers=2, readers=2)
+    print(f"{results['writes']} écritures, {results['reads']} lectures, {results['errors']} erreurs")
+    assert results['lock_errors'] == 0
+
+def test_query_plans(app, tmp_path):
+    """Vérifie que les pages de liste passent par leurs index (EXPLAIN sur une base migrée et remplie)"""
+    print("\n=== Test des plans de requête ===")
+    app.config['UPLOAD_FOLDER'] = str(tmp_path / 'uploads')
+    with app.app_context():
+        # Corpus synthétique de 10 000 documents : sur quelques lignes, le choix du planificateur ne dit rien
+        seed_corpus('10k')
+        # Statistiques des tables et index, pour que le planificateur tienne compte du volume
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+        results = check_query_plans()
+    for result in results:
+        print(f"{result['name']} : {'OK' if result['ok'] else ', '.join(result['problems'])}")
+    assert all(result['ok'] for result in results)
+
+def test_search_document_text(app):
+    """Vérifie que le texte extrait est indexé tel quel, même avec un « < » (pas de HTML à retirer)"""
+    with app.app_context():
+        document = Document(title='Relevés', filename='releves.txt', original_filename='releves.txt')
+        document.extracted_text = DocumentText(status='done',
+                                               content='concentration x<y and after that glaciers melt')
+        db.session.add(document)
+        db.session.flush()
+        index_document(document)
+        db.session.commit()
+        for word in ('concentration', 'glaciers'):
+            results, _ = search_entries(word, kind='document')
+            assert [result['id'] for result in results] == [document.id], word
+
 if __name__ == '__main__':
     print("=== Diagnostic de l'application ===")
-    test_environment()
-    test_database()
-    test_routes()
+    app = create_app()
+    test_environment(app)
+    test_database(app)
+    test_routes(app)
@@ -0,0 +1,222 @@
+"""Export et import de la bibliothèque en JSONL, en flux et par lots.
+
+Le fichier contient une ligne d'en-tête, puis les lignes de chaque table
+dans l'ordre des clés étrangères, chacune suivie d'une ligne de contrôle
+(nombre de lignes et SHA-256 des lignes de la table), puis une ligne de
+fin. Un nom en .gz est compressé.
+
+La lecture de la base se fait par curseur (yield_per) et l'écriture par
+INSERT groupés qui conservent les identifiants : la mémoire utilisée ne
+dépend pas de la taille de la bibliothèque. Les lignes déjà présentes sont
+ignorées (ON CONFLICT DO NOTHING) et l'avancement est noté à côté du fichier
+après chaque lot : un import interrompu reprend là où il s'est arrêté.
+
+Les fichiers eux-mêmes restent dans le stockage adressé par contenu
+(uploads/objects) : seules leurs métadonnées sont exportées.
+"""
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import os
+
+from sqlalchemy import DateTime, select, text
+
+from models import db, dialect_insert
+
+logger = logging.getLogger(__name__)
+
+FORMAT = 'climate-blog-export'
+FORMAT_VERSION = 1
+# Tables exportées, dans l'ordre des clés étrangères (les comptes ne sont pas exportés)
+TABLES = ('stored_file', 'tag', 'article', 'document', 'document_text', 'document_tags')
+
+
+def _open(path, mode, compressed=None):
+    if compressed is None:
+        compressed = path.endswith('.gz')
+    if compressed:
+        return gzip.open(path, mode + 'b', compresslevel=6)
+    return open(path, mode + 'b')
+
+
+def _line(record):
+    return (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def _encode_row(table, row):
+    data = {}
+    for column in table.columns:
+        value = row[column.name]
+        if isinstance(value, datetime.datetime):
+            value = value.isoformat()
+        data[column.name] = value
+    return data
+
+
+def _decode_row(table, data):
+    row = {}
+    for column in table.columns:
+        value = data.get(column.name)
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.datetime.fromisoformat(value)
+        row[column.name] = value
+    return row
+
+
+def export_data(path, batch_size=1000):
+    """Écrit toute la bibliothèque dans path. Retourne le nombre de lignes par table."""
+    if db.engine.dialect.name == 'postgresql':
+        # Un seul instantané pour toutes les tables
+        db.session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+    counts = {}
+    tmp_path = f"{path}.tmp"
+    with _open(tmp_path, 'w', compressed=path.endswith('.gz')) as f:
+        f.write(_line({'type': 'header', 'format': FORMAT, 'version': FORMAT_VERSION,
+                       'date': datetime.datetime.utcnow().isoformat(timespec='seconds'),
+                       'tables': list(TABLES)}))
+        for name in TABLES:
+            table = db.metadata.tables[name]
+            digest = hashlib.sha256()
+            rows = 0
+            statement = (select(table)
+                         .order_by(*table.primary_key.columns)
+                         .execution_options(yield_per=batch_size))
+            for row in db.session.execute(statement).mappings():
+                line = _line({'type': 'row', 'table': name, 'data': _encode_row(table, row)})
+                digest.update(line)
+                f.write(line)
+                rows += 1
+            f.write(_line({'type': 'checksum', 'table': name, 'rows': rows, 'sha256': digest.hexdigest()}))
+            counts[name] = rows
+            logger.info(f"Export : {rows} lignes pour {name}")
+        f.write(_line({'type': 'end'}))
+    db.session.rollback()
+    os.replace(tmp_path, path)
+    return counts
+
+
+def _records(path):
+    """Lignes du fichier : (numéro, octets bruts, enregistrement)"""
+    with _open(path, 'r') as f:
+        for number, line in enumerate(f, 1):
+            try:
+                yield number, line, json.loads(line)
+            except ValueError:
+                raise ValueError(f"Ligne {number} illisible dans {path}")
+
+
+def verify_export(path):
+    """Relit tout le fichier et contrôle en-tête, sommes et fin. Retourne le nombre de lignes par table."""
+    counts = {}
+    digest = hashlib.sha256()
+    rows = 0
+    header = ended = False
+    for number, line, record in _records(path):
+        kind = record.get('type')
+        if not header:
+            if kind != 'header' or record.get('format') != FORMAT:
+                raise ValueError(f"{path} n'est pas un export de la bibliothèque")
+            if record.get('version') != FORMAT_VERSION:
+                raise ValueError(f"Version d'export non prise en charge : {record.get('version')}")
+            header = True
+        elif kind == 'row':
+            digest.update(line)
+            rows += 1
+        elif kind == 'checksum':
+            if rows != record['rows'] or digest.hexdigest() != record['sha256']:
+                raise ValueError(f"Somme de contrôle invalide pour la table {record['table']} (ligne {number})")
+            counts[record['table']] = rows
+            digest = hashlib.sha256()
+            rows = 0
+        elif kind == 'end':
+            ended = True
+    if not ended:
+        raise ValueError(f"Export incomplet : {path} ne se termine pas par une ligne de fin")
+    return counts
+
+
+def _progress_path(path):
+    return f"{path}.progress"
+
+
+def _source_id(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def _read_progress(path):
+    try:
+        with open(_progress_path(path)) as f:
+            progress = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    # Un autre fichier sous le même nom : on repart du début
+    return progress['line'] if progress.get('source') == _source_id(path) else 0
+
+
+def _write_progress(path, line):
+    tmp_path = f"{_progress_path(path)}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'source': _source_id(path), 'line': line}, f)
+    os.replace(tmp_path, _progress_path(path))
+
+
+def _reset_sequences():
+    """PostgreSQL : les séquences repartent après les identifiants importés"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for name in TABLES:
+        table = db.metadata.tables[name]
+        if 'id' in table.columns and table.columns['id'].autoincrement is not False and len(table.primary_key) == 1:
+            db.session.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM {name}), 0) + 1, false)"
+            ))
+
+
+def import_data(path, batch_size=1000, resume=True):
+    """Importe un export dans la base courante. Retourne le nombre de lignes ajoutées par table.
+
+    Le fichier est d'abord vérifié en entier : rien n'est écrit s'il est
+    corrompu ou tronqué.
+    """
+    verify_export(path)
+    start_line = _read_progress(path) if resume else 0
+    if start_line:
+        logger.info(f"Import : reprise après la ligne {start_line}")
+
+    inserted = dict.fromkeys(TABLES, 0)
+    batch, batch_table, last_line = [], None, start_line
+
+    def flush():
+        if batch:
+            table = db.metadata.tables[batch_table]
+            statement = dialect_insert(table).on_conflict_do_nothing(
+                index_elements=[column.name for column in table.primary_key.columns]
+            )
+            result = db.session.execute(statement, batch)
+            inserted[batch_table] += max(result.rowcount, 0)
+            batch.clear()
+        db.session.commit()
+        _write_progress(path, last_line)
+
+    for number, line, record in _records(path):
+        if number <= start_line or record.get('type') != 'row':
+            continue
+        if record['table'] != batch_table or len(batch) >= batch_size:
+            flush()
+            batch_table = record['table']
+        table = db.metadata.tables.get(record['table'])
+        if table is None:
+            raise ValueError(f"Table inconnue dans l'export : {record['table']}")
+        batch.append(_decode_row(table, record['data']))
+        last_line = number
+    flush()
+
+    _reset_sequences()
+    db.session.commit()
+    os.remove(_progress_path(path))
+    return inserted
+